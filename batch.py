@@ -0,0 +1,320 @@
+import io
+import os
+import csv
+import sys
+import json
+import time
+import argparse
+import contextlib
+import multiprocessing
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+
+# Job settings a manifest may set, with the type CSV values are parsed as.
+JOB_SETTINGS = {
+    "fps": int,
+    "quality": int,
+    "width": int,
+    "workers": int,
+    "dedupe_threshold": float,
+    "dirty_rects": bool,
+    "gif_palette": str,
+    "gif_subsample": int,
+    "gif_dither": bool,
+    "segments": int,
+    "crf": int,
+    "cache_dir": str,
+    "cache_key": str,
+    "frame_cache_dir": str,
+    "frame_cache_max_bytes": int,
+}
+
+# Decode workers per job. Jobs already run in parallel, so one thread each avoids oversubscription.
+DEFAULT_JOB_WORKERS = 1
+
+DEFAULT_SUMMARY = "batch_summary.json"
+
+
+def _parse_setting(name, value):
+    if value is None or value == "":
+        return None
+    kind = JOB_SETTINGS[name]
+    if kind is bool and isinstance(value, str):
+        return value.strip().lower() in ("1", "true", "yes", "on")
+    return kind(value)
+
+
+def _make_job(entry, defaults, base_dir):
+    # Manifest paths are relative to the manifest itself
+    if not entry.get("input") or not entry.get("output"):
+        raise ValueError(f"Manifest entry needs 'input' and 'output': {entry}")
+    unknown = set(entry) - set(JOB_SETTINGS) - {"input", "output"}
+    if unknown:
+        raise ValueError(f"Unknown job settings {sorted(unknown)}. Choose from: {', '.join(JOB_SETTINGS)}.")
+
+    settings = dict(defaults)
+    for name in JOB_SETTINGS:
+        if name in entry:
+            value = _parse_setting(name, entry[name])
+            if value is not None:
+                settings[name] = value
+    return {
+        "input": os.path.join(base_dir, entry["input"]),
+        "output": os.path.join(base_dir, entry["output"]),
+        "settings": settings,
+    }
+
+
+def load_manifest(manifest_path, defaults=None):
+    """
+    Reads jobs from a JSON or CSV manifest.
+
+    JSON manifests are a list of objects (or {"jobs": [...]}); CSV manifests have a header
+    row. Every job needs "input" (a PNG sequence folder) and "output"; any key of
+    `JOB_SETTINGS` (fps, quality, width, ...) overrides `defaults` for that job.
+    Relative paths are resolved against the manifest's folder.
+    """
+    base_dir = os.path.dirname(os.path.abspath(manifest_path))
+    defaults = defaults or {}
+    if manifest_path.lower().endswith(".csv"):
+        with open(manifest_path, newline="") as f:
+            entries = [{k.strip(): v for k, v in row.items() if k} for row in csv.DictReader(f)]
+    else:
+        with open(manifest_path) as f:
+            entries = json.load(f)
+        if isinstance(entries, dict):
+            entries = entries.get("jobs", [])
+    return [_make_job(entry, defaults, base_dir) for entry in entries]
+
+
+def discover_jobs(root, output_dir, extension, defaults=None):
+    """
+    Creates one job per folder under `root` that contains PNG files.
+
+    Outputs mirror the tree: `<root>/shots/a` becomes `<output_dir>/shots/a<extension>`
+    (the root folder itself becomes `<output_dir>/<root name><extension>`).
+    """
+    jobs = []
+    root = os.path.abspath(root)
+    for folder, dirs, files in os.walk(root):
+        dirs.sort()
+        if not any(f.lower().endswith(".png") for f in files):
+            continue
+        rel = os.path.relpath(folder, root)
+        if rel == ".":
+            rel = os.path.basename(root)
+        jobs.append({
+            "input": folder,
+            "output": os.path.join(output_dir, rel + extension),
+            "settings": dict(defaults or {}),
+        })
+    return jobs
+
+
+def _last_error(log):
+    for line in reversed(log.splitlines()):
+        if line.startswith("Error"):
+            return line
+    return "conversion failed"
+
+
+def run_job(job, progress_callback=None):
+    """
+    Converts one job in a worker process and returns its summary record.
+    `progress_callback` is passed on to `convert_images`.
+    """
+    from convert import convert_images
+    from instrument import Instrumentation
+
+    settings = dict(job["settings"])
+    settings.setdefault("workers", DEFAULT_JOB_WORKERS)
+    record = {"input": job["input"], "output": job["output"], "size": None, "seconds": 0.0,
+              "stages": None, "error": None}
+
+    instrument = Instrumentation()
+    log = io.StringIO()
+    start = time.perf_counter()
+    try:
+        output_dir = os.path.dirname(job["output"])
+        if output_dir:
+            os.makedirs(output_dir, exist_ok=True)
+        # Keep parallel jobs from interleaving their output
+        with contextlib.redirect_stdout(log):
+            size = convert_images(job["input"], job["output"], progress_callback=progress_callback,
+                                      instrument=instrument, **settings)
+        if size:
+            record["size"] = size
+        else:
+            record["error"] = _last_error(log.getvalue())
+    except Exception as e:
+        record["error"] = str(e)
+    record["seconds"] = time.perf_counter() - start
+    record["stages"] = {name: stage["seconds"] for name, stage in instrument.report()["stages"].items()}
+    return record
+
+
+def run_batch(jobs, max_jobs=None, retries=1, skip_existing=False, progress_callback=None):
+    """
+    Runs jobs on a process pool and returns one record per job, in job order.
+
+    Failed jobs are retried up to `retries` times; a job that keeps failing (or crashes
+    its worker process) is recorded with its error and the rest of the batch carries on.
+    A crash breaks the whole pool, so the jobs it caught are run again one at a time,
+    without counting that attempt, until the one that crashes is found.
+
+    Args:
+        jobs (list): Jobs from `load_manifest` or `discover_jobs`.
+        max_jobs (int): Concurrent jobs (default: one per CPU).
+        retries (int): Extra attempts per failed job.
+        skip_existing (bool): Skip jobs whose output already exists.
+        progress_callback (callable): Called with (jobs finished, total jobs, record).
+
+    Returns:
+        list: Records with "input", "output", "status" ("ok", "failed", "skipped"),
+        "attempts", "size", "seconds", "stages" and "error".
+    """
+    max_jobs = max(1, max_jobs or os.cpu_count() or 1)
+    records = [None] * len(jobs)
+    queue = deque()
+    for index, job in enumerate(jobs):
+        if skip_existing and os.path.exists(job["output"]):
+            records[index] = {"input": job["input"], "output": job["output"], "status": "skipped", "attempts": 0,
+                              "size": os.path.getsize(job["output"]), "seconds": 0.0, "stages": None, "error": None}
+        else:
+            queue.append((index, 1))
+
+    finished = sum(record is not None for record in records)
+    context = multiprocessing.get_context("spawn")
+    pool = ProcessPoolExecutor(max_workers=max_jobs, mp_context=context)
+    running = {}
+    # Jobs that were in a pool when a worker crashed; each runs alone until one crashes again
+    suspects = set()
+    try:
+        while queue or running:
+            while queue and len(running) < max_jobs:
+                if running and (queue[0][0] in suspects or any(index in suspects for index, _ in running.values())):
+                    break
+                index, attempt = queue.popleft()
+                running[pool.submit(run_job, jobs[index])] = (index, attempt)
+
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            if any(isinstance(future.exception(), BrokenProcessPool) for future in done):
+                # A crashed worker takes the whole pool down, and every job still in it fails the same way
+                caught = [future for future in running
+                          if future not in done or isinstance(future.exception(), BrokenProcessPool)]
+                pool.shutdown(wait=False, cancel_futures=True)
+                pool = ProcessPoolExecutor(max_workers=max_jobs, mp_context=context)
+                if len(caught) > 1:
+                    # Which one crashed is unknown: run each again alone, without using up an attempt
+                    for future in reversed(caught):
+                        index, attempt = running.pop(future)
+                        suspects.add(index)
+                        queue.appendleft((index, attempt))
+                    done = [future for future in done if future in running]
+
+            for future in done:
+                index, attempt = running.pop(future)
+                try:
+                    record = future.result()
+                except BrokenProcessPool as e:
+                    record = {"input": jobs[index]["input"], "output": jobs[index]["output"], "size": None,
+                              "seconds": 0.0, "stages": None, "error": f"worker process died: {e}"}
+                except Exception as e:
+                    record = {"input": jobs[index]["input"], "output": jobs[index]["output"], "size": None,
+                              "seconds": 0.0, "stages": None, "error": str(e)}
+
+                if record["error"] and attempt <= retries:
+                    print(f"Retrying {jobs[index]['input']} ({record['error']})")
+                    queue.append((index, attempt + 1))
+                    continue
+
+                record["status"] = "failed" if record["error"] else "ok"
+                record["attempts"] = attempt
+                records[index] = record
+                finished += 1
+                if progress_callback:
+                    progress_callback(finished, len(jobs), record)
+    finally:
+        pool.shutdown(wait=True, cancel_futures=True)
+    return records
+
+
+def write_summary(records, summary_path, seconds):
+    """
+    Writes the batch summary JSON and returns it.
+    """
+    summary = {
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "seconds": seconds,
+        "jobs": len(records),
+        "ok": sum(record["status"] == "ok" for record in records),
+        "failed": sum(record["status"] == "failed" for record in records),
+        "skipped": sum(record["status"] == "skipped" for record in records),
+        "bytes": sum(record["size"] or 0 for record in records),
+        "results": records,
+    }
+    with open(summary_path, "w") as f:
+        json.dump(summary, f, indent=2)
+    return summary
+
+
+def print_record(finished, total, record):
+    if record["status"] == "ok":
+        print(f"[{finished}/{total}] {record['size']} bytes in {record['seconds']:.2f}s -> {record['output']}")
+    elif record["status"] == "skipped":
+        print(f"[{finished}/{total}] skipped (exists) {record['output']}")
+    else:
+        print(f"[{finished}/{total}] FAILED after {record['attempts']} attempt(s): {record['error']} ({record['input']})")
+
+
+def main():
+    from formats import extension_map
+
+    parser = argparse.ArgumentParser(description="Convert many PNG sequences in parallel.")
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--manifest", help="JSON or CSV manifest of jobs (input, output and optional settings).")
+    source.add_argument("--tree", help="Convert every folder containing PNG files below this directory.")
+    parser.add_argument("--output-dir", help="Where --tree writes its outputs (mirroring the tree).")
+    parser.add_argument("--format", choices=sorted(extension_map()), default="avif",
+                        help="Output format for --tree (default: avif).")
+    parser.add_argument("--fps", type=int, default=24, help="Default frames per second (default: 24).")
+    parser.add_argument("--quality", type=int, default=85, help="Default quality (0-100) (default: 85).")
+    parser.add_argument("--width", type=int, help="Default target width for resizing.")
+    parser.add_argument("--jobs", type=int, default=os.cpu_count() or 1,
+                        help=f"Jobs converted at once (default: {os.cpu_count() or 1}).")
+    parser.add_argument("--retries", type=int, default=1, help="Extra attempts for failed jobs (default: 1).")
+    parser.add_argument("--skip-existing", action="store_true", help="Skip jobs whose output already exists.")
+    parser.add_argument("--summary", default=DEFAULT_SUMMARY, help=f"Summary JSON path (default: {DEFAULT_SUMMARY}).")
+
+    args = parser.parse_args()
+    if args.tree and not args.output_dir:
+        parser.error("--tree needs --output-dir")
+
+    defaults = {"fps": args.fps, "quality": args.quality, "width": args.width}
+    try:
+        if args.manifest:
+            jobs = load_manifest(args.manifest, defaults)
+        else:
+            jobs = discover_jobs(args.tree, args.output_dir, extension_map()[args.format], defaults)
+    except (OSError, ValueError) as e:
+        print(f"Error reading jobs: {e}")
+        sys.exit(1)
+
+    if not jobs:
+        print("No jobs found.")
+        sys.exit(1)
+
+    print(f"Running {len(jobs)} jobs, {min(args.jobs, len(jobs))} at a time...")
+    start = time.perf_counter()
+    records = run_batch(jobs, args.jobs, args.retries, args.skip_existing, progress_callback=print_record)
+    summary = write_summary(records, args.summary, time.perf_counter() - start)
+
+    print(f"\n{summary['ok']} ok, {summary['failed']} failed, {summary['skipped']} skipped in "
+          f"{summary['seconds']:.1f}s ({summary['bytes'] / (1024 * 1024):.1f} MB). Summary written to {args.summary}")
+    if summary["failed"]:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,320 @@
+import io
+import os
+import sys
+import json
+import queue as queue_module
+import time
+import shutil
+import argparse
+import contextlib
+import platform
+import tempfile
+import multiprocessing
+
+import numpy as np
+from PIL import Image
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+# Default benchmark matrix
+RESOLUTIONS = ["320x240", "1280x720", "1920x1080"]
+FRAME_COUNTS = [24, 96]
+ALPHA_PATTERNS = ["opaque", "gradient", "sprite"]
+FORMATS = ["avif", "webm", "mov", "gif", "apng"]
+
+# Smaller matrix for a quick smoke run
+QUICK = {
+    "resolutions": ["320x240"],
+    "frames": [24],
+    "alpha": ["opaque", "sprite"],
+}
+
+# Relative slowdown that counts as a regression when comparing with a baseline.
+DEFAULT_THRESHOLD = 0.10
+
+# Slowdowns smaller than this (seconds) are run-to-run noise, whatever their percentage.
+DEFAULT_MIN_SLOWDOWN = 0.05
+
+# Runs per case; the fastest one is recorded, as it is the least disturbed by the rest of the machine.
+DEFAULT_REPEAT = 3
+
+
+def make_frame(width, height, index, count, alpha):
+    """
+    Renders one synthetic RGBA frame.
+
+    Args:
+        alpha (str): "opaque" (moving color field, no transparency), "gradient"
+            (the same with a soft alpha ramp) or "sprite" (a small moving disc on a
+            fully transparent canvas, like a UI animation).
+    """
+    y, x = np.mgrid[0:height, 0:width].astype(np.float32)
+    phase = index / max(1, count)
+    frame = np.zeros((height, width, 4), dtype=np.uint8)
+
+    if alpha == "sprite":
+        radius = max(4, min(width, height) // 10)
+        cx = radius + (width - 2 * radius) * phase
+        cy = height / 2
+        inside = (x - cx) ** 2 + (y - cy) ** 2 <= radius ** 2
+        frame[inside] = (230, 80, 40, 255)
+        return frame
+
+    frame[:, :, 0] = (x / width * 255 + phase * 255) % 256
+    frame[:, :, 1] = y / height * 255
+    frame[:, :, 2] = (128 + 127 * np.sin(2 * np.pi * (x / width + phase))).astype(np.uint8)
+    if alpha == "gradient":
+        frame[:, :, 3] = (x / width * 255).astype(np.uint8)
+    else:
+        frame[:, :, 3] = 255
+    return frame
+
+
+def generate_sequence(folder, width, height, count, alpha):
+    """
+    Writes a synthetic PNG sequence into `folder` (skipped if it is already complete).
+    """
+    os.makedirs(folder, exist_ok=True)
+    existing = [f for f in os.listdir(folder) if f.endswith(".png")]
+    if len(existing) == count:
+        return
+    for i in range(count):
+        frame = make_frame(width, height, i, count, alpha)
+        Image.fromarray(frame).save(os.path.join(folder, f"frame_{i:05d}.png"), compress_level=1)
+
+
+def _peak_rss_bytes():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def _run_case(case, queue):
+    # Runs in a fresh process so peak RSS belongs to this case alone
+    with contextlib.redirect_stdout(io.StringIO()):
+        _measure_case(case, queue)
+
+
+def _measure_case(case, queue):
+    import convert
+    from instrument import Instrumentation
+
+    folder, output_file = case["folder"], case["output"]
+    stages = {}
+    peak_rss = None
+    try:
+        # One end-to-end run through the public API; its instrumentation gives the stage split
+        instrument = Instrumentation()
+        start = time.perf_counter()
+        size = convert.convert_images(folder, output_file, case["fps"], case["quality"], instrument=instrument)
+        total = time.perf_counter() - start
+        peak_rss = _peak_rss_bytes()
+        if not size:
+            raise RuntimeError("convert_images failed")
+
+        for name, stage in instrument.report()["stages"].items():
+            stages[name] = stage["seconds"]
+        stages["total"] = total
+
+        queue.put({
+            "stages": stages,
+            "frames_per_second": case["frames"] / stages["total"] if stages["total"] else None,
+            "peak_rss_bytes": peak_rss,
+            "output_bytes": size,
+            "error": None,
+        })
+    except Exception as e:
+        queue.put({"stages": stages, "frames_per_second": None, "peak_rss_bytes": peak_rss,
+                   "output_bytes": None, "error": str(e)})
+
+
+def run_case(case, repeat=1):
+    """
+    Benchmarks one (sequence, format) case `repeat` times, each in a separate process, and
+    returns the record of the fastest run with every run's total time under "runs".
+    """
+    runs = [_run_case_once(case) for _ in range(max(1, repeat))]
+    ok = [run for run in runs if not run["error"]]
+    result = min(ok, key=lambda run: run["stages"]["total"]) if ok else runs[-1]
+    record = {key: case[key] for key in ("name", "format", "width", "height", "frames", "alpha")}
+    record.update(result)
+    record["runs"] = [run["stages"]["total"] for run in ok]
+    return record
+
+
+def _run_case_once(case):
+    context = multiprocessing.get_context("spawn")
+    queue = context.Queue()
+    process = context.Process(target=_run_case, args=(case, queue))
+    process.start()
+    try:
+        result = None
+        while result is None:
+            try:
+                result = queue.get(timeout=1)
+            except queue_module.Empty:
+                if not process.is_alive():
+                    result = {"stages": {}, "frames_per_second": None, "peak_rss_bytes": None,
+                              "output_bytes": None, "error": f"worker exited with code {process.exitcode}"}
+    finally:
+        process.join()
+    return result
+
+
+def case_name(resolution, count, alpha, format_name):
+    return f"{resolution}-{count}f-{alpha}-{format_name}"
+
+
+def run_benchmarks(work_dir, resolutions, frame_counts, alphas, formats, fps=24, quality=85, repeat=DEFAULT_REPEAT):
+    """
+    Generates every synthetic sequence of the matrix and benchmarks each format on it,
+    keeping the fastest of `repeat` runs per case.
+
+    Returns:
+        list: One record per case with per-stage times (scan/decode/resize/encode/write, as
+        reported by `instrument.Instrumentation`) and total wall time, frames/sec, peak RSS
+        and output size.
+    """
+    from formats import get_format
+
+    results = []
+    for resolution in resolutions:
+        width, height = (int(v) for v in resolution.lower().split("x"))
+        for count in frame_counts:
+            for alpha in alphas:
+                folder = os.path.join(work_dir, "sequences", f"{resolution}-{count}f-{alpha}")
+                print(f"Generating {folder}...")
+                generate_sequence(folder, width, height, count, alpha)
+
+                for format_name in formats:
+                    name = case_name(resolution, count, alpha, format_name)
+                    output = os.path.join(work_dir, "outputs", name + get_format(format_name).extension)
+                    os.makedirs(os.path.dirname(output), exist_ok=True)
+                    case = {"name": name, "format": format_name, "width": width, "height": height,
+                            "frames": count, "alpha": alpha, "folder": folder, "output": output,
+                            "fps": fps, "quality": quality}
+
+                    record = run_case(case, repeat)
+                    results.append(record)
+                    if record["error"]:
+                        print(f"  {name}: FAILED ({record['error']})")
+                    else:
+                        stages = " ".join(f"{k}={v:.2f}s" for k, v in record["stages"].items())
+                        rss = record["peak_rss_bytes"]
+                        rss_str = f"{rss / (1024 * 1024):.0f} MB" if rss else "n/a"
+                        print(f"  {name}: {stages} {record['frames_per_second']:.1f} fps, "
+                              f"peak RSS {rss_str}, {record['output_bytes']} bytes")
+    return results
+
+
+def environment():
+    """
+    Describes the machine and library versions a benchmark ran with.
+    """
+    import PIL
+    import imageio
+    info = {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "pillow": PIL.__version__,
+        "imageio": imageio.__version__,
+        "numpy": np.__version__,
+    }
+    try:
+        import imageio_ffmpeg
+        info["ffmpeg"] = imageio_ffmpeg.get_ffmpeg_version()
+    except Exception:
+        info["ffmpeg"] = None
+    return info
+
+
+def compare(results, baseline, threshold=DEFAULT_THRESHOLD, min_slowdown=DEFAULT_MIN_SLOWDOWN):
+    """
+    Compares total wall time and output size of each case against a baseline run.
+
+    Returns:
+        list: Names of the cases whose total time regressed by more than `threshold`
+        and by more than `min_slowdown` seconds.
+    """
+    previous = {record["name"]: record for record in baseline.get("results", [])}
+    regressions = []
+    print(f"\n{'case':<40} {'total':>9} {'baseline':>9} {'change':>8} {'bytes':>8}")
+    for record in results:
+        old = previous.get(record["name"])
+        if not old or record["error"] or old.get("error"):
+            continue
+        new_total = record["stages"]["total"]
+        old_total = old["stages"]["total"]
+        change = (new_total - old_total) / old_total if old_total else 0.0
+        size_change = ((record["output_bytes"] - old["output_bytes"]) / old["output_bytes"]
+                       if old["output_bytes"] else 0.0)
+        flag = ""
+        if change > threshold and new_total - old_total > min_slowdown:
+            regressions.append(record["name"])
+            flag = "  REGRESSION"
+        print(f"{record['name']:<40} {new_total:>8.2f}s {old_total:>8.2f}s {change:>+7.1%} {size_change:>+7.1%}{flag}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the PNG sequence conversion pipeline.")
+    parser.add_argument("--output", default="bench_results.json", help="Where to write the results JSON.")
+    parser.add_argument("--baseline", help="Compare against a previous results JSON.")
+    parser.add_argument("--save-baseline", help="Also write the results to this path as the new baseline.")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD * 100,
+                        help="Slowdown in percent that counts as a regression (default: 10).")
+    parser.add_argument("--min-slowdown", type=float, default=DEFAULT_MIN_SLOWDOWN,
+                        help=f"Ignore slowdowns below this many seconds (default: {DEFAULT_MIN_SLOWDOWN}).")
+    parser.add_argument("--repeat", type=int, default=DEFAULT_REPEAT,
+                        help=f"Runs per case; the fastest is recorded (default: {DEFAULT_REPEAT}).")
+    parser.add_argument("--resolutions", default=",".join(RESOLUTIONS), help="Comma-separated WxH list.")
+    parser.add_argument("--frames", default=",".join(str(n) for n in FRAME_COUNTS), help="Comma-separated frame counts.")
+    parser.add_argument("--alpha", default=",".join(ALPHA_PATTERNS), help="Comma-separated alpha patterns.")
+    parser.add_argument("--formats", default=",".join(FORMATS), help="Comma-separated formats.")
+    parser.add_argument("--quick", action="store_true", help="Run a small matrix (320x240, 24 frames).")
+    parser.add_argument("--work-dir", help="Keep generated sequences and outputs here (default: a temp dir).")
+
+    args = parser.parse_args()
+
+    resolutions = args.resolutions.split(",")
+    frame_counts = [int(n) for n in args.frames.split(",")]
+    alphas = args.alpha.split(",")
+    if args.quick:
+        resolutions, frame_counts, alphas = QUICK["resolutions"], QUICK["frames"], QUICK["alpha"]
+
+    work_dir = args.work_dir or tempfile.mkdtemp(prefix="sequence2motion-bench-")
+    try:
+        results = run_benchmarks(work_dir, resolutions, frame_counts, alphas, args.formats.split(","),
+                                 repeat=args.repeat)
+    finally:
+        if not args.work_dir:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    report = {"created": time.strftime("%Y-%m-%dT%H:%M:%S"), "environment": environment(), "results": results}
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"\nResults written to {args.output}")
+    if args.save_baseline:
+        shutil.copyfile(args.output, args.save_baseline)
+        print(f"Baseline saved to {args.save_baseline}")
+
+    failed = [record["name"] for record in results if record["error"]]
+    regressions = []
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.threshold / 100, args.min_slowdown)
+        if regressions:
+            print(f"\n{len(regressions)} regression(s) over {args.threshold:.0f}%: {', '.join(regressions)}")
+
+    if failed or regressions:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,254 @@
+import os
+import json
+import time
+import hashlib
+import tempfile
+import threading
+
+import convert
+from cache import hash_frames
+
+# Frames per trial encode, taken as a few runs of consecutive frames spread over the sequence
+# so that inter-frame compression is represented.
+DEFAULT_SAMPLES = 12
+DEFAULT_SAMPLE_RUNS = 3
+
+# Upper bound on new trial encodes per search.
+DEFAULT_MAX_TRIALS = 8
+
+# Upper bound on full encodes.
+DEFAULT_MAX_ENCODES = 3
+
+# A full encode this far (as a fraction of the budget) under budget is good enough.
+DEFAULT_TOLERANCE = 0.10
+
+# Setting searched for each format, with its values ordered from smallest to largest output.
+BUDGET_SETTINGS = {
+    "AVIF": ("quality", list(range(0, 101))),
+    "WebM": ("crf", list(range(63, 3, -1))),
+}
+
+# Trial sizes live in their own folder inside the output cache, apart from its entries.
+TRIALS_DIR = "budget"
+TRIALS_FILE = "budget_trials.json"
+
+
+def sample_frames(files, samples=DEFAULT_SAMPLES, runs=DEFAULT_SAMPLE_RUNS):
+    """
+    Picks about `samples` file names as `runs` evenly spaced runs of consecutive frames.
+    Short sequences are used whole.
+    """
+    if len(files) <= samples:
+        return list(files)
+    runs = max(1, min(runs, samples))
+    run_length = samples // runs
+    picked = []
+    for r in range(runs):
+        start = round(r * (len(files) - run_length) / max(1, runs - 1))
+        picked.extend(files[start:start + run_length])
+    return picked
+
+
+class TrialCache:
+    """
+    Remembers the size of trial encodes by sample frames, format and settings.
+
+    With `cache_dir`, trials are also kept in a JSON file in its `budget` folder, so
+    repeated budget runs on an unchanged sequence (e.g. with another budget) need few or
+    no new trials.
+    """
+
+    def __init__(self, cache_dir=None):
+        trials_dir = os.path.join(cache_dir, TRIALS_DIR) if cache_dir else None
+        self.path = os.path.join(trials_dir, TRIALS_FILE) if trials_dir else None
+        self.entries = {}
+        self._lock = threading.Lock()
+        if self.path:
+            os.makedirs(trials_dir, exist_ok=True)
+            try:
+                with open(self.path) as f:
+                    self.entries = json.load(f)
+            except (FileNotFoundError, ValueError):
+                self.entries = {}
+
+    def key(self, frames_hash, settings):
+        payload = json.dumps({"frames": frames_hash, "settings": settings}, sort_keys=True)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def get(self, key):
+        return self.entries.get(key)
+
+    def put(self, key, size):
+        with self._lock:
+            self.entries[key] = size
+            if self.path:
+                tmp = f"{self.path}.{os.getpid()}.{threading.get_ident()}.tmp"
+                with open(tmp, "w") as f:
+                    json.dump(self.entries, f)
+                os.replace(tmp, self.path)
+
+
+def convert_to_budget(input_folder, output_file, max_bytes, fps=24, quality=85, width=None,
+                      samples=DEFAULT_SAMPLES, max_trials=DEFAULT_MAX_TRIALS, max_encodes=DEFAULT_MAX_ENCODES,
+                      tolerance=DEFAULT_TOLERANCE, cache_dir=None, **options):
+    """
+    Converts a sequence at the best quality (AVIF) or CRF (WebM) whose output fits in `max_bytes`.
+
+    Each candidate setting is tried on a subsample of `samples` frames and its full size
+    estimated by scaling with the frame count. A binary search over the setting needs at
+    most `max_trials` new trial encodes; their sizes are cached (see `TrialCache`). The
+    chosen setting is then encoded once in full with `convert_images`.
+
+    The subsample misjudges inter-frame compression by a factor that varies only slowly
+    with the setting, so every full encode calibrates the estimates near its setting (the
+    factors are cached for later runs). If a full encode lands over budget, or more than `tolerance` under it,
+    the search is repeated with the calibrated estimates, for at most `max_encodes` full
+    encodes; the best output within budget is kept.
+
+    Args:
+        input_folder (str): Folder containing PNG images.
+        output_file (str): Path to the .avif or .webm output.
+        max_bytes (int): Size budget of the output.
+        fps (int): Frames per second.
+        quality (int): Unused for AVIF (it is searched); kept for other encoder paths.
+        width (int): Target width for resizing (optional).
+        samples (int): Frames per trial encode.
+        max_trials (int): Bound on new trial encodes per search.
+        max_encodes (int): Bound on full encodes.
+        tolerance (float): Fraction of the budget that may stay unused without another encode.
+        cache_dir (str): Output cache directory (optional); trial sizes are kept there too.
+        **options: Passed on to `convert_images` (workers, segments, frame_cache_dir, ...).
+
+    Returns:
+        dict: {"setting", "value", "size", "within_budget", "trials", "cached_trials",
+        "trial_seconds", "encodes", "encode_seconds"}, or False on failure.
+    """
+    format_name = convert.get_format_name(output_file)
+    if format_name not in BUDGET_SETTINGS:
+        print(f"Error: a size budget needs an {' or '.join(BUDGET_SETTINGS)} output, not {format_name}.")
+        return False
+    setting, values = BUDGET_SETTINGS[format_name]
+
+    files = convert.scan_input(input_folder)
+    if not files:
+        return False
+
+    sample = sample_frames(files, samples)
+    frames = list(convert.iter_frames(input_folder, sample, width))
+    frames_hash = hash_frames(input_folder, sample, "stat")
+    trial_cache = TrialCache(cache_dir)
+    ext = os.path.splitext(output_file)[1]
+    report = {"setting": setting, "value": None, "size": None, "within_budget": False, "trials": 0,
+              "cached_trials": 0, "trial_seconds": 0.0, "encodes": 0, "encode_seconds": 0.0}
+
+    def encode_settings(value):
+        settings = {"quality": quality, "crf": options.get("crf")}
+        settings[setting] = value
+        return settings
+
+    estimates = {}
+
+    def estimate(value):
+        if value in estimates:
+            return estimates[value]
+        key = trial_cache.key(frames_hash, dict(encode_settings(value), ext=ext, fps=fps, width=width))
+        size = trial_cache.get(key)
+        if size is None:
+            fd, trial_file = tempfile.mkstemp(suffix=ext)
+            os.close(fd)
+            start = time.perf_counter()
+            try:
+                settings = encode_settings(value)
+                convert.write_output(frames, trial_file, fps, settings["quality"], crf=settings["crf"])
+                size = os.path.getsize(trial_file)
+            finally:
+                os.remove(trial_file)
+            report["trials"] += 1
+            report["trial_seconds"] += time.perf_counter() - start
+            trial_cache.put(key, size)
+        else:
+            report["cached_trials"] += 1
+        estimates[value] = size * len(files) / len(frames)
+        return estimates[value]
+
+    # Full size / subsample estimate per setting value, learned from full encodes of this sequence
+    calibration_key = trial_cache.key(frames_hash, {"calibration": True, "ext": ext, "fps": fps, "width": width,
+                                                    "frames": len(files), "crf": options.get("crf")})
+    calibration = trial_cache.get(calibration_key) or {}
+
+    def calibrated(value):
+        if not calibration:
+            return estimate(value)
+        nearest = min(calibration, key=lambda known: abs(int(known) - value))
+        return estimate(value) * calibration[nearest]
+
+    def search(lo, hi):
+        # Largest index in values[lo:hi + 1] whose calibrated estimate fits, or None
+        best = None
+        trials_before = report["trials"]
+        while lo <= hi and report["trials"] - trials_before < max_trials:
+            mid = (lo + hi) // 2
+            if calibrated(values[mid]) <= max_bytes:
+                best, lo = mid, mid + 1
+            else:
+                hi = mid - 1
+        return best
+
+    kept_file = f"{output_file}.budget{ext}"
+    best = None
+    lo, hi = 0, len(values) - 1
+    try:
+        while report["encodes"] < max_encodes and lo <= hi:
+            index = search(lo, hi)
+            if index is None:
+                if best is not None:
+                    break
+                index = lo
+                print(f"Even {setting} {values[index]} is estimated over budget; encoding at that setting.")
+
+            value = values[index]
+            print(f"Encoding with {setting} {value} (estimated {calibrated(value) / 1024:.0f} KB, "
+                  f"budget {max_bytes / 1024:.0f} KB)...")
+            if best is not None:
+                # Keep the best output so far in case this one overshoots
+                os.replace(output_file, kept_file)
+            start = time.perf_counter()
+            settings = encode_settings(value)
+            size = convert.convert_images(input_folder, output_file, fps, settings["quality"], width=width,
+                                          cache_dir=cache_dir, **dict(options, crf=settings["crf"]))
+            report["encodes"] += 1
+            report["encode_seconds"] += time.perf_counter() - start
+            if not size:
+                if best is not None:
+                    os.replace(kept_file, output_file)
+                return False
+
+            report.update(value=value, size=size)
+            calibration[str(value)] = size / estimate(value)
+            trial_cache.put(calibration_key, calibration)
+            if size <= max_bytes:
+                best = (value, size)
+                lo = index + 1
+                if size >= max_bytes * (1 - tolerance):
+                    break
+            else:
+                if best is not None:
+                    os.replace(kept_file, output_file)
+                elif index == 0:
+                    break
+                hi = index - 1
+    finally:
+        if os.path.exists(kept_file):
+            os.remove(kept_file)
+
+    if best is not None:
+        report.update(value=best[0], size=best[1], within_budget=True)
+    return report
+
+
+def print_budget_report(report, max_bytes):
+    status = "within" if report["within_budget"] else "OVER"
+    print(f"Budget: {report['size']} of {max_bytes} bytes ({status} budget) at {report['setting']} {report['value']}.")
+    print(f"Budget search: {report['trials']} trial encodes in {report['trial_seconds']:.2f}s "
+          f"({report['cached_trials']} cached lookups), {report['encodes']} full encode(s) "
+          f"in {report['encode_seconds']:.2f}s.")
@@ -0,0 +1,319 @@
+import os
+import re
+import json
+import stat
+import shutil
+import hashlib
+import tempfile
+import threading
+
+from formats import formats
+
+# Default size bound for the output cache (2 GB).
+DEFAULT_CACHE_MAX_BYTES = 2 * 1024 * 1024 * 1024
+
+# Default location and size bound of the decoded-frame cache (8 GB).
+DEFAULT_FRAME_CACHE_DIR = os.path.join(tempfile.gettempdir(), "sequence2motion-frames")
+DEFAULT_FRAME_CACHE_MAX_BYTES = 8 * 1024 * 1024 * 1024
+
+# Output cache entries are named by their sha256 key.
+_KEY_NAME = re.compile(r"[0-9a-f]{64}")
+
+# Folder names of decoded-frame cache entries.
+_ENTRY_NAME = re.compile(r"[0-9a-f]{32}")
+
+# Bump when encoder settings change in a way that invalidates cached outputs.
+CACHE_VERSION = 1
+
+
+def hash_frames(input_folder, files, mode="content"):
+    """
+    Hashes a frame sequence.
+
+    Args:
+        input_folder (str): Folder containing the frames.
+        files (list): Frame file names, in sequence order.
+        mode (str): "content" hashes file bytes; "stat" only hashes path, size and mtime,
+            which is much faster but misses edits that preserve both.
+    """
+    digest = hashlib.sha256()
+    for name in files:
+        path = os.path.join(input_folder, name)
+        digest.update(name.encode("utf-8"))
+        if mode == "stat":
+            st = os.stat(path)
+            digest.update(f"{os.path.abspath(path)}:{st.st_size}:{st.st_mtime_ns}".encode("utf-8"))
+        else:
+            with open(path, "rb") as f:
+                for block in iter(lambda: f.read(1024 * 1024), b""):
+                    digest.update(block)
+    return digest.hexdigest()
+
+
+class OutputCache:
+    """
+    Content-addressed on-disk cache of encoded outputs.
+
+    Entries are stored as `<key><ext>` in the cache directory; other files there are
+    never counted or evicted. Hits are served by
+    copying the entry to the requested output path (never by linking, so later writes
+    to the output cannot change the entry) and refresh the entry's mtime, which is
+    what LRU eviction orders by.
+    """
+
+    STATS_FILE = "stats.json"
+
+    def __init__(self, cache_dir, max_bytes=DEFAULT_CACHE_MAX_BYTES):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def make_key(self, frames_hash, ext, settings):
+        """
+        Combines a frame hash with the output format and encode settings into a cache key.
+        """
+        payload = json.dumps(
+            {"version": CACHE_VERSION, "frames": frames_hash, "ext": ext.lower(), "settings": settings},
+            sort_keys=True,
+        )
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def _entry_path(self, key, ext):
+        return os.path.join(self.cache_dir, key + ext.lower())
+
+    def fetch(self, key, output_file):
+        """
+        Places the cached result for `key` at `output_file`. Returns True on a hit.
+        """
+        entry = self._entry_path(key, os.path.splitext(output_file)[1])
+        if not os.path.exists(entry):
+            self._record("misses")
+            return False
+
+        # Copy next to the output and move it into place, so readers never see a partial file
+        tmp = f"{output_file}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            shutil.copyfile(entry, tmp)
+            os.replace(tmp, output_file)
+        finally:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+
+        os.utime(entry)
+        self._record("hits")
+        return True
+
+    def store(self, key, output_file):
+        """
+        Copies a freshly encoded output into the cache and evicts old entries if needed.
+        """
+        entry = self._entry_path(key, os.path.splitext(output_file)[1])
+        tmp = f"{entry}.{os.getpid()}.{threading.get_ident()}.tmp"
+        shutil.copyfile(output_file, tmp)
+        os.replace(tmp, entry)
+        self.evict()
+
+    def _entries(self):
+        # Only `<key><ext>` files of known formats; anything else in the directory is not ours
+        extensions = {ext.lower() for output_format in formats() for ext in output_format.extensions}
+        entries = []
+        for name in os.listdir(self.cache_dir):
+            key, ext = os.path.splitext(name)
+            if not _KEY_NAME.fullmatch(key) or ext not in extensions:
+                continue
+            path = os.path.join(self.cache_dir, name)
+            try:
+                st = os.stat(path)
+            except FileNotFoundError:
+                continue
+            if not stat.S_ISREG(st.st_mode):
+                continue
+            entries.append((st.st_mtime, st.st_size, path))
+        return entries
+
+    def evict(self):
+        """
+        Removes least recently used entries until the cache fits in `max_bytes`.
+        """
+        entries = sorted(self._entries())
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in entries:
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+
+    def _load_stats(self):
+        try:
+            with open(os.path.join(self.cache_dir, self.STATS_FILE)) as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return {"hits": 0, "misses": 0}
+
+    def _record(self, counter):
+        with self._lock:
+            stats = self._load_stats()
+            stats[counter] = stats.get(counter, 0) + 1
+            with open(os.path.join(self.cache_dir, self.STATS_FILE), "w") as f:
+                json.dump(stats, f)
+
+    def stats(self):
+        """
+        Returns hit/miss counters plus the current entry count and total size.
+        """
+        stats = self._load_stats()
+        entries = self._entries()
+        stats["entries"] = len(entries)
+        stats["bytes"] = sum(size for _, size, _ in entries)
+        return stats
+
+
+def _file_signature(input_folder, files):
+    signature = []
+    for name in files:
+        st = os.stat(os.path.join(input_folder, name))
+        signature.append([name, st.st_size, st.st_mtime_ns])
+    return signature
+
+
+class FrameCache:
+    """
+    On-disk cache of decoded (and resized) RGBA frames, stored as a memory-mapped
+    NumPy stack of shape (frames, height, width, 4) next to a small JSON index.
+
+    One entry is kept per (folder, width). An entry is only used while the name,
+    size and mtime of every source file still match its index.
+    """
+
+    INDEX_FILE = "index.json"
+    FRAMES_FILE = "frames.npy"
+
+    def __init__(self, cache_dir=DEFAULT_FRAME_CACHE_DIR, max_bytes=DEFAULT_FRAME_CACHE_MAX_BYTES):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def _entry_dir(self, input_folder, width):
+        name = f"{os.path.abspath(input_folder)}|{width or 0}"
+        return os.path.join(self.cache_dir, hashlib.sha256(name.encode("utf-8")).hexdigest()[:32])
+
+    def load(self, input_folder, files, width=None):
+        """
+        Returns a read-only memory-mapped frame stack, or None if there is no valid entry.
+        """
+        import numpy as np
+
+        entry = self._entry_dir(input_folder, width)
+        try:
+            with open(os.path.join(entry, self.INDEX_FILE)) as f:
+                index = json.load(f)
+            if index["files"] != _file_signature(input_folder, files):
+                return None
+            stack = np.load(os.path.join(entry, self.FRAMES_FILE), mmap_mode="r")
+        except (FileNotFoundError, ValueError, KeyError):
+            return None
+
+        if stack.shape[0] != len(files):
+            return None
+        os.utime(entry)
+        return stack
+
+    def store(self, input_folder, files, width, frames):
+        """
+        Passes `frames` through unchanged while writing them to a new cache entry.
+
+        The entry is committed only once every frame has been written; frames of
+        differing sizes (which cannot be stacked), and stacks larger than `max_bytes`
+        (which eviction would remove straight away), simply leave the cache untouched.
+        """
+        import numpy as np
+
+        entry = self._entry_dir(input_folder, width)
+        os.makedirs(entry, exist_ok=True)
+        index_path = os.path.join(entry, self.INDEX_FILE)
+        frames_path = os.path.join(entry, self.FRAMES_FILE)
+        # Conversions in other threads may be storing the same entry
+        tmp_path = f"{frames_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            os.remove(index_path)
+        except FileNotFoundError:
+            pass
+
+        stack = None
+        written = 0
+        try:
+            for i, frame in enumerate(frames):
+                if written == i:
+                    rgba = frame if frame.mode == "RGBA" else frame.convert("RGBA")
+                    arr = np.asarray(rgba)
+                    if stack is None and len(files) * arr.nbytes <= self.max_bytes:
+                        stack = np.lib.format.open_memmap(tmp_path, mode="w+", dtype=np.uint8,
+                                                          shape=(len(files),) + arr.shape)
+                    if stack is None:
+                        print(f"Decoded frames (~{len(files) * arr.nbytes / (1024 * 1024):.0f} MB) exceed "
+                              f"the frame cache limit; not caching them.")
+                        written = -1
+                    elif arr.shape == stack.shape[1:]:
+                        stack[i] = arr
+                        written += 1
+                yield frame
+
+            if stack is not None and written == len(files):
+                stack.flush()
+                stack = None
+                try:
+                    os.replace(tmp_path, frames_path)
+                    with open(index_path, "w") as f:
+                        json.dump({"folder": os.path.abspath(input_folder), "width": width,
+                                   "files": _file_signature(input_folder, files)}, f)
+                except OSError:
+                    # Lost a race with another store of the same entry (e.g. the frames file is
+                    # mapped by a reader on Windows); the cache only saves work, so skip it
+                    pass
+                else:
+                    self.evict()
+        finally:
+            stack = None
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            try:
+                os.rmdir(entry)  # Only if nothing was stored
+            except OSError:
+                pass
+
+    def _is_entry(self, name, entry):
+        if not _ENTRY_NAME.fullmatch(name) or not os.path.isdir(entry):
+            return False
+        return any(os.path.exists(os.path.join(entry, f)) for f in (self.INDEX_FILE, self.FRAMES_FILE))
+
+    def evict(self):
+        """
+        Removes least recently used entries until the cache fits in `max_bytes`.
+
+        Only entry folders (named by `_entry_dir`, holding an index or frame stack) are
+        counted and removed; anything else in `cache_dir` is left alone.
+        """
+        entries = []
+        for name in os.listdir(self.cache_dir):
+            entry = os.path.join(self.cache_dir, name)
+            if not self._is_entry(name, entry):
+                continue  # Never touch folders this cache did not create
+            size = 0
+            for f in os.listdir(entry):
+                try:
+                    size += os.path.getsize(os.path.join(entry, f))
+                except FileNotFoundError:
+                    pass
+            entries.append((os.path.getmtime(entry), size, entry))
+
+        entries.sort()
+        total = sum(size for _, size, _ in entries)
+        for _, size, entry in entries:
+            if total <= self.max_bytes:
+                break
+            shutil.rmtree(entry, ignore_errors=True)
+            total -= size
@@ -1,16 +1,669 @@
 import os
 import argparse
+import io
+import math
+import subprocess
 import sys
-from PIL import Image
-import pillow_avif
+import threading
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from itertools import chain
+from PIL import Image, ImageFile
 
-import imageio
-import numpy as np
+from cache import DEFAULT_CACHE_MAX_BYTES, DEFAULT_FRAME_CACHE_MAX_BYTES, FrameCache, OutputCache, hash_frames
+from formats import extension_map, format_for_path, format_import_timings, get_format, load_backend
+from instrument import Cancelled, Instrumentation, OffsetInstrumentation, format_report, profiled
+from preflight import DEFAULT_INDEX_DIR, scan_frames, scan_problems
 
-def convert_images(input_folder, output_file, fps=24, quality=85, width=None, progress_callback=None):
+# Maximum number of decoded frames held in memory by the streaming (WebM/Safari) path.
+DEFAULT_FRAME_WINDOW = 8
+
+# Default number of decode/resize workers.
+DEFAULT_WORKERS = min(4, os.cpu_count() or 1)
+
+# WebM/Safari are encoded in one ffmpeg process unless split into more segments.
+DEFAULT_SEGMENTS = 1
+
+
+
+def scan_input(input_folder, index_dir=DEFAULT_INDEX_DIR):
+    """
+    Lists the PNG frames of a folder and checks them before any decoding (see
+    `preflight.scan_frames`), printing a message and returning None on failure.
+
+    Unreadable frames and frames of another size fail the scan; gaps in the numbering
+    and mixed color modes are printed as warnings.
+    """
+    try:
+        report = scan_frames(input_folder, index_dir=index_dir)
+    except FileNotFoundError:
+        print(f"Error: Folder '{input_folder}' not found.")
+        return None
+    except Exception as e:
+        print(f"Error accessing folder: {e}")
+        return None
+
+    files = report["files"]
+    if not files:
+        print(f"No PNG files found in '{input_folder}'.")
+        return None
+
+    errors, warnings = scan_problems(report)
+    for warning in warnings:
+        print(f"Warning: {warning}.")
+    if errors:
+        for error in errors:
+            print(f"Error: {error}.")
+        return None
+
+    print(f"Found {len(files)} images ({report['width']}x{report['height']}, {report['mode']} "
+          f"{report['bit_depth']}-bit).")
+    return files
+
+
+def load_frame(file_path, width=None):
+    """
+    Decodes a single PNG, resizing it to `width` if that is smaller than the original.
+    """
+    return _load_frame_timed(file_path, width)[0]
+
+
+def _load_frame_timed(file_path, width=None):
+    # Returns (image, decode seconds, resize seconds or None if not resized)
+    start = time.perf_counter()
+    img = Image.open(file_path)
+    img.load()
+    decoded = time.perf_counter()
+
+    if width and width < img.width:
+        img = resize_frame(img, width)
+        return img, decoded - start, time.perf_counter() - decoded
+
+    return img, decoded - start, None
+
+
+def resize_frame(img, width):
+    """
+    Resizes an image to `width`, keeping its aspect ratio.
+    """
+    aspect_ratio = img.height / img.width
+    new_height = int(width * aspect_ratio)
+    return img.resize((width, new_height), Image.Resampling.LANCZOS)
+
+
+def _load_frame_for_process(file_path, width=None):
+    # Plain Image objects pickle cleanly across processes; PngImageFile does not.
+    img, decode_seconds, resize_seconds = _load_frame_timed(file_path, width)
+    if isinstance(img, ImageFile.ImageFile):
+        img = img.copy()
+    return img, decode_seconds, resize_seconds
+
+
+def iter_frames(input_folder, files, width=None, frame_window=DEFAULT_FRAME_WINDOW, progress_callback=None,
+                workers=DEFAULT_WORKERS, use_processes=False, instrument=None):
+    """
+    Yields decoded frames in order, decoding at most `frame_window` frames ahead of the consumer.
+
+    Decoding and resizing run on a pool of `workers` threads (or processes) so they
+    overlap with each other and with encoding. Frames are always delivered in sorted
+    order, and no new work is submitted while the window is full (backpressure).
+    Decode and resize times are added to `instrument`, which also reports one "decode"
+    event per delivered frame.
+
+    `files` may also be an iterator of file names that only become available over time
+    (see `follow.follow_frames`); the frame total is then unknown.
+    """
+    if instrument is None:
+        instrument = Instrumentation(progress_callback)
+    total_files = len(files) if hasattr(files, "__len__") else None
+    names = iter(files)
+    workers = max(1, workers or 1)
+    window = max(workers, frame_window or 1)
+    # Pillow releases the GIL while decoding and resampling, so threads usually suffice.
+    executor_class = ProcessPoolExecutor if use_processes and workers > 1 else ThreadPoolExecutor
+    loader = _load_frame_for_process if executor_class is ProcessPoolExecutor else _load_frame_timed
+    pool = executor_class(max_workers=workers)
+    pending = deque()
+    try:
+        i = 0
+        exhausted = False
+        while True:
+            while not exhausted and len(pending) < window:
+                name = next(names, None)
+                if name is None:
+                    exhausted = True
+                    break
+                pending.append(pool.submit(loader, os.path.join(input_folder, name), width))
+            if not pending:
+                break
+
+            img, decode_seconds, resize_seconds = pending.popleft().result()
+            instrument.add("decode", decode_seconds)
+            if resize_seconds is not None:
+                instrument.add("resize", resize_seconds)
+            instrument.emit("decode", i, total_files, f"Loading image {i+1}/{total_files or '?'}...")
+            i += 1
+
+            yield img
+    finally:
+        pool.shutdown(wait=True, cancel_futures=True)
+
+
+def open_frames(input_folder, files, width=None, frame_window=DEFAULT_FRAME_WINDOW, progress_callback=None,
+                workers=DEFAULT_WORKERS, use_processes=False, frame_cache_dir=None, instrument=None,
+                frame_cache_max_bytes=DEFAULT_FRAME_CACHE_MAX_BYTES):
+    """
+    Returns an iterator over the decoded frames of a sequence.
+
+    With `frame_cache_dir`, frames come zero-copy from a memory-mapped cache entry
+    when the source files are unchanged; otherwise they are decoded as usual and
+    written to a new entry on the way through, unless they exceed `frame_cache_max_bytes`.
+    """
+    if instrument is None:
+        instrument = Instrumentation(progress_callback)
+    if not frame_cache_dir:
+        return iter_frames(input_folder, files, width, frame_window,
+                           workers=workers, use_processes=use_processes, instrument=instrument)
+
+    frame_cache = FrameCache(frame_cache_dir, frame_cache_max_bytes)
+    stack = frame_cache.load(input_folder, files, width)
+    if stack is None:
+        frames = iter_frames(input_folder, files, width, frame_window,
+                             workers=workers, use_processes=use_processes, instrument=instrument)
+        return frame_cache.store(input_folder, files, width, frames)
+
+    print("Using cached decoded frames.")
+    return _iter_cached_frames(stack, instrument)
+
+
+def _iter_cached_frames(stack, instrument):
+    total_files = len(stack)
+    for i in range(total_files):
+        instrument.emit("decode", i, total_files, f"Loading image {i+1}/{total_files} (cached)...")
+        yield stack[i]
+
+
+def as_image(frame):
+    """
+    Returns a frame as a PIL Image; NumPy frames are wrapped without copying where possible.
+    """
+    if isinstance(frame, Image.Image):
+        return frame
+    return Image.fromarray(frame)
+
+
+def estimate_buffer_bytes(input_folder, files, width=None):
+    """
+    Estimates the memory needed to hold every frame at once (as the Pillow-based
+    AVIF/GIF/APNG encoders require), assuming 4 bytes per pixel.
+    """
+    with Image.open(os.path.join(input_folder, files[0])) as img:
+        frame_width, frame_height = img.size
+    if width and width < frame_width:
+        frame_height = int(width * (frame_height / frame_width))
+        frame_width = width
+    return frame_width * frame_height * 4 * len(files)
+
+
+def get_format_name(output_file):
+    # Unknown extensions fall back to AVIF
+    return format_for_path(output_file).name
+
+
+def is_streaming(format_name):
+    """
+    Returns True if the format's encoder takes frames one at a time (WebM, Safari).
+    """
+    return get_format(format_name).streaming
+
+
+def _output_size(output_file):
+    try:
+        if hasattr(output_file, "write"):
+            return output_file.tell()
+        return os.path.getsize(output_file)
+    except (OSError, ValueError):
+        return None
+
+
+def _video_codec(format_name, crf=None):
+    # (codec, pixel format, extra ffmpeg parameters) of a video format
+    if format_name == "WebM":
+        # Note: WebM supports transparency with VP9 but handling it perfectly depends on params.
+        # pixel_format='yuva420p' allows alpha
+        return 'libvpx-vp9', 'yuva420p', ['-crf', str(crf), '-b:v', '0'] if crf is not None else []
+    # HEVC (Safari) with alpha
+    # Parameters mimic Apple's requirements for transparency
+    return 'prores_ks', 'yuva444p10le', ['-alpha_bits', '16', '-profile:v', '4444']
+
+
+def write_video(frames, output_file, fps, format_name, instrument=None, total=None, crf=None):
+    """
+    Streams frames into an ffmpeg writer (WebM or Safari), one frame at a time.
+    `crf` (0-63, lower is better) sets WebM's constant quality; by default libvpx picks it.
+
+    Time spent handing each frame to ffmpeg counts as "encode" and closing the writer
+    (flushing the encoder) as "write". `instrument` gets one "encode" event per frame
+    with the output size so far; `total` is the expected frame count, if known.
+    """
+    if instrument is None:
+        instrument = Instrumentation()
+    if hasattr(output_file, "write"):
+        write_video_pipe(frames, output_file, fps, format_name, instrument, total, crf)
+        return
+
+    load_backend(format_name)
+    import imageio
+    import numpy as np
+
+    # Use imageio for WebM and HEVC (Safari)
+    codec, pixelformat, ffmpeg_params = _video_codec(format_name, crf)
+    writer = imageio.get_writer(output_file, fps=fps, codec=codec, pixelformat=pixelformat,
+                                ffmpeg_params=ffmpeg_params or None)
+    try:
+        for i, img in enumerate(frames):
+            start = time.perf_counter()
+            writer.append_data(np.asarray(img))
+            instrument.add("encode", time.perf_counter() - start)
+            instrument.emit("encode", i, total, f"Encoding {format_name} frame {i+1}/{total or '?'}...",
+                            bytes_written=_output_size(output_file), output=output_file)
+    finally:
+        with instrument.stage("write"):
+            writer.close()
+
+
+def write_video_pipe(frames, output, fps, format_name, instrument=None, total=None, crf=None):
+    """
+    Streams frames through ffmpeg into a writable file object, without temporary files.
+
+    Frames (RGB or RGBA uint8 arrays or images) are written to ffmpeg's stdin as they are,
+    and the encoded stream is copied from its stdout to `output` on a background thread.
+    The ffmpeg command mirrors `write_video`'s imageio writer. MOV output is fragmented
+    (`empty_moov`), since a pipe cannot be rewound to write the index at the front.
+    """
+    if instrument is None:
+        instrument = Instrumentation()
+    load_backend(format_name)
+    import imageio_ffmpeg
+    import numpy as np
+
+    codec, pixelformat, ffmpeg_params = _video_codec(format_name, crf)
+    frames = iter(frames)
+    first = next(frames, None)
+    if first is None:
+        raise ValueError("no frames to encode")
+    height, width, channels = np.asarray(first).shape
+
+    cmd = [imageio_ffmpeg.get_ffmpeg_exe(), "-y", "-f", "rawvideo", "-vcodec", "rawvideo", "-s", f"{width}x{height}",
+           "-pix_fmt", "rgba" if channels == 4 else "rgb24", "-r", f"{fps:.02f}", "-i", "-",
+           "-an", "-vcodec", codec, "-pix_fmt", pixelformat]
+    if width % 16 or height % 16:
+        # Same padding to macro blocks as imageio
+        cmd += ["-vf", f"scale={width + -width % 16}:{height + -height % 16}"]
+    cmd += ["-v", "warning"] + ffmpeg_params
+    cmd += ["-f", "webm"] if format_name == "WebM" else ["-f", "mov", "-movflags", "frag_keyframe+empty_moov"]
+    cmd.append("pipe:1")
+
+    process = subprocess.Popen(cmd, stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+
+    def drain():
+        for chunk in iter(lambda: process.stdout.read(1 << 16), b""):
+            output.write(chunk)
+
+    reader = threading.Thread(target=drain, daemon=True)
+    reader.start()
+    try:
+        for i, img in enumerate(chain([first], frames)):
+            start = time.perf_counter()
+            process.stdin.write(np.ascontiguousarray(np.asarray(img), dtype=np.uint8).data)
+            instrument.add("encode", time.perf_counter() - start)
+            instrument.emit("encode", i, total, f"Encoding {format_name} frame {i+1}/{total or '?'}...",
+                            bytes_written=_output_size(output), output=output)
+    except Cancelled:
+        # Don't let ffmpeg flush the frames it has buffered
+        process.kill()
+        raise
+    finally:
+        with instrument.stage("write"):
+            process.stdin.close()
+            process.wait()
+            reader.join()
+    if process.returncode != 0:
+        raise RuntimeError(f"ffmpeg exited with code {process.returncode}")
+
+
+def split_segments(count, segments, align=1):
+    """
+    Splits `count` frames into at most `segments` contiguous (start, end) ranges of
+    near-equal length, with every range starting at a multiple of `align`.
+    """
+    blocks = math.ceil(count / align)
+    segments = max(1, min(segments, blocks))
+    bounds = [min(count, blocks * i // segments * align) for i in range(segments + 1)]
+    return [(start, end) for start, end in zip(bounds[:-1], bounds[1:]) if end > start]
+
+
+def segment_alignment(fps):
+    """
+    Returns the smallest frame count whose duration is a whole number of milliseconds.
+
+    WebM stores timestamps in milliseconds, so segments that start on such a frame
+    keep exactly the timestamps a single encode would give them.
+    """
+    return fps // math.gcd(1000, fps)
+
+
+def join_segments(segment_files, durations, output_file):
+    """
+    Concatenates encoded segments into `output_file` without re-encoding, using ffmpeg's
+    concat demuxer with stream copy (alpha is carried over as is). `durations` gives each
+    segment's exact length in seconds, so later segments are not shifted by rounding.
+    """
+    import imageio_ffmpeg
+
+    list_file = output_file + ".segments.txt"
+    with open(list_file, "w") as f:
+        for path, duration in zip(segment_files, durations):
+            escaped = os.path.abspath(path).replace("'", "'\\''")
+            f.write(f"file '{escaped}'\nduration {duration:.9f}\n")
+    try:
+        result = subprocess.run([imageio_ffmpeg.get_ffmpeg_exe(), "-y", "-v", "error", "-f", "concat", "-safe", "0",
+                                 "-i", list_file, "-map", "0", "-c", "copy", output_file],
+                                capture_output=True, text=True)
+        if result.returncode != 0:
+            raise RuntimeError(f"joining segments failed: {result.stderr.strip()}")
+    finally:
+        os.remove(list_file)
+
+
+def write_video_segmented(load_segment, count, output_file, fps, format_name, segments, instrument=None,
+                          crf=None):
+    """
+    Encodes a WebM or Safari video as `segments` chunks in parallel ffmpeg writers, then
+    joins them losslessly into `output_file`.
+
+    Each chunk starts with a keyframe, so the result is slightly larger than a single
+    encode; pixel format (and alpha) and frame timestamps are the same.
+
+    Args:
+        load_segment (callable): Returns an iterable over frames [start, end).
+        count (int): Total number of frames.
+        output_file (str): Path to the output .webm/.mov file.
+        fps (int): Frames per second.
+        format_name (str): "WebM" or "Safari".
+        segments (int): Number of chunks encoded at once.
+        instrument (Instrumentation): Receives per-frame events and stage timings.
+        crf (int): WebM constant quality; see `write_video`.
+    """
+    if instrument is None:
+        instrument = Instrumentation()
+    ranges = split_segments(count, segments, segment_alignment(fps))
+    base, ext = os.path.splitext(output_file)
+    parts = [f"{base}.part{k:03d}{ext}" for k in range(len(ranges))]
+
+    def encode(k):
+        start, end = ranges[k]
+        view = OffsetInstrumentation(instrument, start, count)
+        write_video(load_segment(start, end, view), parts[k], fps, format_name, view, crf=crf)
+        return k
+
+    try:
+        done = 0
+        with ThreadPoolExecutor(max_workers=len(ranges)) as pool:
+            futures = [pool.submit(encode, k) for k in range(len(ranges))]
+            for future in as_completed(futures):
+                start, end = ranges[future.result()]
+                done += end - start
+                instrument.emit("encode", done - 1, count,
+                                f"Encoding {format_name} ({len(ranges)} segments): {done}/{count} frames...")
+
+        with instrument.stage("write"):
+            join_segments(parts, [(end - start) / fps for start, end in ranges], output_file)
+    finally:
+        for part in parts:
+            instrument.discard(part)
+            if os.path.exists(part):
+                os.remove(part)
+
+
+def write_pillow(images, output_file, duration, quality, format_name, dirty_rects=True,
+                 gif_palette="local", gif_subsample=4, gif_dither=False, instrument=None):
+    """
+    Saves a list of frames with Pillow (AVIF, GIF or APNG).
+    `duration` is either one value in milliseconds or a list with one value per frame.
+
+    With `dirty_rects`, GIF and APNG frames after the first only encode the rectangle
+    that changed since the previous frame (see `optimize.write_gif`/`write_apng`). GIFs
+    where most of the canvas changes every frame are written as full frames instead.
+    With `gif_palette="global"`, GIF frames share one palette sampled from the whole
+    sequence (see `optimize.GlobalPalette`).
+
+    The whole call counts as "encode" in `instrument`, which gets one "encode" event per
+    frame. Pillow's own savers (AVIF, full frames) report each frame as it is handed to
+    the encoder (see `_TrackedFrame`), so a cancelled `instrument` stops them between frames.
+
+    Returns:
+        dict: Stage timings in seconds for the global GIF palette, otherwise None.
+    """
+    if instrument is None:
+        instrument = Instrumentation()
+    load_backend(format_name)
+    with instrument.stage("encode", count=len(images)):
+        return _write_pillow(images, output_file, duration, quality, format_name, dirty_rects,
+                             gif_palette, gif_subsample, gif_dither, instrument)
+
+
+class _TrackedFrame(Image.Image):
+    # Shares another image's pixels and calls `on_load(index)` whenever it is loaded.
+    # Pillow's AVIF, GIF and APNG savers load every frame right before encoding it.
+
+    def load(self):
+        self.on_load(self.index)
+        return super().load()
+
+
+def _tracked_frames(images, on_load):
+    tracked = []
+    for i, img in enumerate(images):
+        img.load()
+        frame = img._new(img.im)
+        frame.__class__ = _TrackedFrame
+        frame.index, frame.on_load = i, on_load
+        tracked.append(frame)
+    return tracked
+
+
+def _write_pillow(images, output_file, duration, quality, format_name, dirty_rects,
+                  gif_palette, gif_subsample, gif_dither, instrument):
+    from optimize import GIF_MAX_RECT_COVERAGE, GlobalPalette, _open_output, write_apng, write_gif
+
+    def progress(done, total, bytes_written):
+        instrument.emit("encode", done - 1, total, f"Encoding {format_name} frame {done}/{total}...",
+                        bytes_written=bytes_written, output=output_file)
+
+    global_palette = None
+    if format_name == "GIF" and gif_palette == "global":
+        global_palette = GlobalPalette(images, subsample=gif_subsample, dither=gif_dither)
+
+    if dirty_rects and format_name == "GIF":
+        if global_palette:
+            written = write_gif(images, output_file, duration, quantize=global_palette,
+                                palette=global_palette.palette, progress=progress,
+                                max_coverage=GIF_MAX_RECT_COVERAGE)
+        else:
+            written = write_gif(images, output_file, duration, progress=progress, max_coverage=GIF_MAX_RECT_COVERAGE)
+        if written:
+            return global_palette.timings if global_palette else None
+        print("Most of the canvas changes every frame; writing full GIF frames.")
+    if dirty_rects and format_name == "PNG":
+        write_apng(images, output_file, duration, progress=progress)
+        return None
+
+    if global_palette:
+        images = [global_palette.to_image(img) for img in images]
+    else:
+        images = [as_image(img) for img in images]
+
+    def frame_loaded(index):
+        instrument.emit("encode", index, len(images), f"Encoding {format_name} frame {index+1}/{len(images)}...",
+                        output=output_file)
+
+    images = _tracked_frames(images, frame_loaded)
+    first_image = images[0]
+    rest_images = images[1:]
+
+    save_kwargs = {
+        "save_all": True,
+        "append_images": rest_images,
+        "duration": duration,
+        "loop": 0,
+    }
+
+    if format_name == "AVIF":
+        save_kwargs["format"] = "AVIF"
+        save_kwargs["quality"] = quality
+        save_kwargs["optimize"] = True
+    elif format_name == "GIF":
+        save_kwargs["format"] = "GIF"
+        # Optimizing would rebuild each frame's palette
+        save_kwargs["optimize"] = global_palette is None
+    elif format_name == "PNG":
+        save_kwargs["format"] = "PNG"
+        save_kwargs["blend"] = 0
+        save_kwargs["disposal"] = 1
+
+    # Pillow only closes files it opened itself on an Exception, not on Cancelled, and an open
+    # output cannot be removed on Windows
+    with _open_output(output_file) as f:
+        first_image.save(f, **save_kwargs)
+    progress(len(images), len(images), _output_size(output_file))
+    return global_palette.timings if global_palette else None
+
+
+def write_output(images, output_file, fps, quality, durations=None, instrument=None, segments=DEFAULT_SEGMENTS,
+                 crf=None, format_name=None, **options):
+    """
+    Encodes already-decoded frames to `output_file`, choosing the encoder by extension.
+
+    `durations` (one value in milliseconds per frame) is used by the Pillow formats;
+    the video formats always play frames at a constant `fps`. Extra `options`
+    (dirty_rects, gif_palette, ...) are passed on to `write_pillow`. Encode progress
+    and timings go to `instrument`. With `segments` > 1, video formats are encoded in
+    that many parallel chunks (see `write_video_segmented`); `crf` sets WebM's quality.
+
+    `output_file` may also be a writable binary file object if `format_name` is given.
+    Video formats then accept any iterable of frames, which is encoded as it is consumed.
+
+    Returns:
+        dict: Encoder stage timings, if the encoder reports any.
+    """
+    output_format = get_format(format_name) if format_name else format_for_path(output_file)
+    format_name = output_format.name
+    if output_format.encoder:
+        load_backend(format_name)
+        return output_format.encoder(images, output_file, fps, quality, durations, instrument, **options)
+    if output_format.streaming:
+        total = len(images) if hasattr(images, "__len__") else None
+        if segments > 1 and total and not hasattr(output_file, "write"):
+            write_video_segmented(lambda start, end, view: images[start:end], total, output_file, fps,
+                                  format_name, segments, instrument, crf=crf)
+        else:
+            write_video(images, output_file, fps, format_name, instrument, total=total, crf=crf)
+        return None
+    return write_pillow(images, output_file, durations or int(1000 / fps), quality, format_name,
+                        instrument=instrument, **options)
+
+
+def print_timings(timings):
+    if timings:
+        print("Timings: " + ", ".join(f"{name} {seconds:.3f}s" for name, seconds in timings.items()))
+
+
+def dedupe_frames(images, duration, threshold):
+    """
+    Collapses held frames for the variable-duration formats and reports how many were merged.
+    """
+    from optimize import collapse_duplicates
+
+    kept, durations = collapse_duplicates(images, duration, threshold)
+    if len(kept) < len(images):
+        print(f"Collapsed {len(images) - len(kept)} duplicate frames ({len(images)} -> {len(kept)}).")
+    return kept, durations
+
+
+def _instrumentation(instrument, progress_callback):
+    # The classic (current, total, message) callback is fed from the structured events
+    if instrument is None:
+        return Instrumentation(progress_callback)
+    if progress_callback:
+        instrument.progress_callback = progress_callback
+    return instrument
+
+
+def _cache_settings(output_file, fps, quality, width, **options):
+    # Every setting that changes the encoded bytes must be part of the cache key.
+    settings = dict(options, fps=fps, quality=quality, width=width)
+    # Segmenting and CRF only change the bytes of the video formats
+    streaming = format_for_path(output_file).streaming
+    if not streaming or settings.get("segments", DEFAULT_SEGMENTS) <= 1:
+        settings.pop("segments", None)
+    if not streaming or settings.get("crf") is None:
+        settings.pop("crf", None)
+    return settings
+
+
+def _segment_loader(input_folder, files, width, frame_window, workers, use_processes, frame_cache_dir):
+    # Segments decode their own frame ranges, or slice a cached decoded-frame stack
+    stack = FrameCache(frame_cache_dir).load(input_folder, files, width) if frame_cache_dir else None
+    if stack is not None:
+        print("Using cached decoded frames.")
+        return lambda start, end, instrument: _iter_cached_frames(stack[start:end], instrument)
+    return lambda start, end, instrument: iter_frames(input_folder, files[start:end], width, frame_window,
+                                                      workers=workers, use_processes=use_processes,
+                                                      instrument=instrument)
+
+
+def _prepare_output(cache, output_file):
+    # Never truncate an output in place when a cache is in use: outputs served by older versions
+    # may still be hard links to an entry.
+    if cache and os.path.lexists(output_file):
+        os.remove(output_file)
+
+
+def _output_stamp(output_file):
+    # Size and mtime of an existing output, to tell later whether a run has written to it
+    try:
+        st = os.stat(output_file)
+    except OSError:
+        return None
+    return st.st_size, st.st_mtime_ns
+
+
+def _remove_cancelled_outputs(stamps):
+    # Removes the outputs a cancelled run had started writing; untouched earlier outputs are kept
+    for output_file, stamp in stamps.items():
+        current = _output_stamp(output_file)
+        if current is not None and current != stamp:
+            os.remove(output_file)
+    print("Conversion cancelled.")
+
+
+def convert_images(input_folder, output_file, fps=24, quality=85, width=None, progress_callback=None,
+                   frame_window=DEFAULT_FRAME_WINDOW, workers=DEFAULT_WORKERS, use_processes=False,
+                   cache_dir=None, cache_max_bytes=DEFAULT_CACHE_MAX_BYTES, cache_key="content",
+                   frame_cache_dir=None, frame_cache_max_bytes=DEFAULT_FRAME_CACHE_MAX_BYTES,
+                   dedupe_threshold=None, dirty_rects=True,
+                   gif_palette="local", gif_subsample=4, gif_dither=False, segments=DEFAULT_SEGMENTS,
+                   crf=None, instrument=None):
     """
     Converts a sequence of PNG images in a folder to an animated AVIF, GIF, APNG, or WebM.
-    
+
+    WebM and Safari outputs are streamed: frames are decoded, resized and handed to the
+    encoder one at a time, so at most `frame_window` decoded frames are in memory.
+    AVIF, GIF and APNG are written by Pillow, which needs every frame up front; their
+    memory ceiling is roughly width * height * 4 bytes * frame count (see README).
+
     Args:
         input_folder (str): Folder containing PNG images.
         output_file (str): Path to the output file (extension determines format).
@@ -18,125 +671,358 @@ def convert_images(input_folder, output_file, fps=24, quality=85, width=None, pr
         quality (int): Quality (0-100).
         width (int): Target width for resizing (optional).
         progress_callback (callable): Function to call with (current, total, message).
-    """
-    images = []
-    
-    # Sort files
-    try:
-        files = [f for f in os.listdir(input_folder) if f.lower().endswith('.png')]
-        files.sort()
-    except FileNotFoundError:
-        print(f"Error: Folder '{input_folder}' not found.")
-        return False
-    except Exception as e:
-        print(f"Error accessing folder: {e}")
-        return False
+        frame_window (int): Maximum number of decoded frames buffered when streaming.
+        workers (int): Number of parallel decode/resize workers.
+        use_processes (bool): Decode in worker processes instead of threads.
+        cache_dir (str): Output cache directory (optional). Unchanged sequences encoded with
+            the same settings are served from the cache instead of being re-encoded.
+        cache_max_bytes (int): Size bound of the output cache; least recently used entries are evicted.
+        cache_key (str): "content" to hash frame bytes, "stat" to hash path/size/mtime only.
+        frame_cache_dir (str): Decoded-frame cache directory (optional). Repeated runs on the
+            same folder and width read RGBA frames from a memory-mapped cache instead of decoding.
+        frame_cache_max_bytes (int): Size bound of the decoded-frame cache; sequences larger
+            than this are not cached, and least recently used entries are evicted.
+        dedupe_threshold (float): If set, AVIF/GIF/APNG merge consecutive frames whose mean
+            absolute difference is at most this value (0 = exact duplicates only) and hold
+            the kept frame for the combined duration.
+        dirty_rects (bool): Encode only the changed rectangle of each GIF/APNG frame.
+        gif_palette (str): "local" builds a palette per GIF frame; "global" samples the whole
+            sequence once and maps every frame to that palette through a cached lookup table.
+        gif_subsample (int): Pixel sampling step for the global GIF palette.
+        gif_dither (bool): Apply ordered dithering when mapping to the global GIF palette.
+        segments (int): Encode WebM/Safari as this many chunks in parallel ffmpeg writers and
+            join them without re-encoding. Each chunk decodes its own frames with
+            `workers // segments` workers and at most `frame_window` buffered frames.
+        crf (int): WebM constant quality (0-63, lower is better); libvpx's default if None.
+        instrument (Instrumentation): Receives structured per-stage progress events
+            (scan/decode/resize/encode/write) and accumulates stage timings; read
+            `instrument.report()` afterwards. `progress_callback` is attached to it.
+            `instrument.cancel()` (from another thread) stops decoding and encoding at the
+            next frame and removes the partly written output.
 
+    Returns:
+        int: The output size in bytes, or False on failure or cancellation.
+    """
+    instrument = _instrumentation(instrument, progress_callback)
+    with instrument.stage("scan"):
+        files = scan_input(input_folder)
     if not files:
-        print(f"No PNG files found in '{input_folder}'.")
         return False
 
     total_files = len(files)
-    print(f"Found {total_files} images.")
+    encoder_options = {"dirty_rects": dirty_rects, "gif_palette": gif_palette,
+                       "gif_subsample": gif_subsample, "gif_dither": gif_dither, "segments": segments,
+                       "crf": crf}
+    stamps = {output_file: _output_stamp(output_file)}
 
     try:
-        # Load images
-        for i, file in enumerate(files):
-            if progress_callback:
-                progress_callback(i, total_files, f"Loading image {i+1}/{total_files}...")
-            
-            file_path = os.path.join(input_folder, file)
-            img = Image.open(file_path)
-            
-            # Resize if width specified and different from original
-            if width and width < img.width:
-                aspect_ratio = img.height / img.width
-                new_height = int(width * aspect_ratio)
-                img = img.resize((width, new_height), Image.Resampling.LANCZOS)
-                
-            images.append(img)
-        
-        if not images:
-             return False
+        instrument.emit("scan", total_files, total_files)
+        cache = None
+        if cache_dir:
+            cache = OutputCache(cache_dir, cache_max_bytes)
+            key = cache.make_key(hash_frames(input_folder, files, cache_key),
+                                 os.path.splitext(output_file)[1],
+                                 _cache_settings(output_file, fps, quality, width, dedupe=dedupe_threshold,
+                                                 **encoder_options))
+            if cache.fetch(key, output_file):
+                print(f"Cache hit: reused cached output for {output_file}.")
+                size = os.path.getsize(output_file)
+                instrument.emit("write", total_files, total_files, "Reused cached output.",
+                                bytes_written=size, output=output_file)
+                return size
+            _prepare_output(cache, output_file)
 
         # Calculate duration per frame in milliseconds
         duration = int(1000 / fps)
 
         print(f"Saving to {output_file}...")
-        
-        ext = os.path.splitext(output_file)[1].lower()
-        format_name = "AVIF"
-        if ext == ".gif":
-            format_name = "GIF"
-        elif ext == ".png":
-            format_name = "PNG" # APNG
-        elif ext == ".webm":
-            format_name = "WebM"
-        elif ext == ".mov":
-            format_name = "Safari" # HEVC
-        
-        if progress_callback:
-            progress_callback(total_files, total_files, f"Encoding {format_name} (this may take a while)...")
-            
+
+        format_name = get_format_name(output_file)
+
         print(f"FPS: {fps}, Duration: {duration}ms, Quality: {quality}, Width: {width if width else 'Original'}, Format: {format_name}")
 
-        if format_name == "WebM":
-             # Use imageio for WebM
-             # Convert images to numpy arrays (RGB or RGBA)
-             # Note: WebM supports transparency with VP9 but handling it perfectly depends on params.
-             # pixel_format='yuva420p' allows alpha
-             writer = imageio.get_writer(output_file, fps=fps, codec='libvpx-vp9', pixelformat='yuva420p')
-             for img in images:
-                 writer.append_data(np.array(img))
-             writer.close()
-        
-        elif format_name == "Safari":
-             # Use imageio for HEVC (Safari) with alpha
-             # Parameters mimic Apple's requirements for transparency
-             writer = imageio.get_writer(
-                output_file, 
-                fps=fps, 
-                codec='prores_ks', 
-                pixelformat='yuva444p10le',
-                ffmpeg_params=['-alpha_bits', '16', '-profile:v', '4444']
-             )
-             for img in images:
-                 writer.append_data(np.array(img))
-             writer.close()
-             
+        if is_streaming(format_name) and segments > 1:
+            load_segment = _segment_loader(input_folder, files, width, frame_window, max(1, workers // segments),
+                                           use_processes, frame_cache_dir)
+            write_video_segmented(load_segment, total_files, output_file, fps, format_name, segments, instrument,
+                                  crf=crf)
+
+        elif is_streaming(format_name):
+            frames = open_frames(input_folder, files, width, frame_window, workers=workers,
+                                 use_processes=use_processes, frame_cache_dir=frame_cache_dir,
+                                 frame_cache_max_bytes=frame_cache_max_bytes, instrument=instrument)
+            write_video(frames, output_file, fps, format_name, instrument, total=total_files, crf=crf)
+
         else:
-            # Pillow formats
-            first_image = images[0]
-            rest_images = images[1:]
-            
-            save_kwargs = {
-                "save_all": True,
-                "append_images": rest_images,
-                "duration": duration,
-                "loop": 0,
-            }
-            
-            if format_name == "AVIF":
-                 save_kwargs["format"] = "AVIF"
-                 save_kwargs["quality"] = quality
-                 save_kwargs["optimize"] = True
-            elif format_name == "GIF":
-                 save_kwargs["format"] = "GIF"
-                 save_kwargs["optimize"] = True
-            elif format_name == "PNG":
-                 save_kwargs["format"] = "PNG"
-                 save_kwargs["blend"] = 0
-                 save_kwargs["disposal"] = 1
-
-            first_image.save(output_file, **save_kwargs)
-        
+            # Pillow formats need every frame at once
+            ceiling = estimate_buffer_bytes(input_folder, files, width)
+            print(f"Buffering {total_files} frames for {format_name} (~{ceiling / (1024 * 1024):.0f} MB).")
+
+            images = list(open_frames(input_folder, files, width, frame_window, workers=workers,
+                                      use_processes=use_processes, frame_cache_dir=frame_cache_dir,
+                                      frame_cache_max_bytes=frame_cache_max_bytes,
+                                      instrument=instrument))
+            if not images:
+                return False
+
+            durations = None
+            if dedupe_threshold is not None:
+                images, durations = dedupe_frames(images, duration, dedupe_threshold)
+
+            print_timings(write_output(images, output_file, fps, quality, durations, instrument, **encoder_options))
+
+        if cache:
+            with instrument.stage("write"):
+                cache.store(key, output_file)
+
+        size = os.path.getsize(output_file)
+        instrument.emit("write", total_files, total_files, bytes_written=size, output=output_file)
         print("Conversion complete!")
-        return os.path.getsize(output_file)
+        return size
 
+    except Cancelled:
+        _remove_cancelled_outputs(stamps)
+        return False
     except Exception as e:
         print(f"Error during conversion: {e}")
         return False
 
+def convert_multi(input_folder, output_files, fps=24, quality=85, width=None, progress_callback=None,
+                  workers=DEFAULT_WORKERS, use_processes=False,
+                  cache_dir=None, cache_max_bytes=DEFAULT_CACHE_MAX_BYTES, cache_key="content",
+                  frame_cache_dir=None, frame_cache_max_bytes=DEFAULT_FRAME_CACHE_MAX_BYTES,
+                  dedupe_threshold=None, dirty_rects=True,
+                  gif_palette="local", gif_subsample=4, gif_dither=False, segments=DEFAULT_SEGMENTS,
+                  crf=None, instrument=None):
+    """
+    Converts one PNG sequence to several outputs, decoding and resizing it only once.
+
+    The shared frames are handed to every encoder in parallel (one thread per output;
+    the ffmpeg and AVIF encoders do their heavy lifting outside the GIL). Like the
+    Pillow paths of `convert_images`, all frames are held in memory at once.
+
+    Args:
+        input_folder (str): Folder containing PNG images.
+        output_files (list): Output paths; each extension determines its format.
+        fps (int): Frames per second.
+        quality (int): Quality (0-100).
+        width (int): Target width for resizing (optional).
+        progress_callback (callable): Function to call with (current, total, message).
+        workers (int): Number of parallel decode/resize workers.
+        use_processes (bool): Decode in worker processes instead of threads.
+        cache_dir (str): Output cache directory (optional); see `convert_images`.
+        cache_max_bytes (int): Size bound of the output cache.
+        cache_key (str): "content" or "stat"; see `convert_images`.
+        frame_cache_dir (str): Decoded-frame cache directory (optional); see `convert_images`.
+        frame_cache_max_bytes (int): Size bound of the decoded-frame cache.
+        dedupe_threshold (float): Duplicate-frame threshold for AVIF/GIF/APNG; see `convert_images`.
+        dirty_rects (bool): Encode only the changed rectangle of each GIF/APNG frame.
+        gif_palette (str): "local" or "global" GIF palette; see `convert_images`.
+        gif_subsample (int): Pixel sampling step for the global GIF palette.
+        gif_dither (bool): Apply ordered dithering when mapping to the global GIF palette.
+        segments (int): Parallel chunks per WebM/Safari output; see `convert_images`.
+        crf (int): WebM constant quality; see `convert_images`.
+        instrument (Instrumentation): Receives structured progress events and stage timings;
+            see `convert_images`. Encode events carry their output path, and encode time is
+            summed over the parallel encoders. Cancelling it stops every encoder and removes
+            all partly written outputs.
+
+    Returns:
+        dict: Maps each output path to {"format", "size", "seconds", "cached", "timings", "error"},
+        where "size" is None if that output failed and "timings" holds encoder stage timings
+        (e.g. GIF palette build and mapping). Returns False if nothing could be decoded or
+        the conversion was cancelled.
+    """
+    instrument = _instrumentation(instrument, progress_callback)
+    with instrument.stage("scan"):
+        files = scan_input(input_folder)
+    if not files:
+        return False
+
+    total_files = len(files)
+    encoder_options = {"dirty_rects": dirty_rects, "gif_palette": gif_palette,
+                       "gif_subsample": gif_subsample, "gif_dither": gif_dither, "segments": segments,
+                       "crf": crf}
+    results = {}
+    keys = {}
+    stamps = {output_file: _output_stamp(output_file) for output_file in output_files}
+
+    try:
+        instrument.emit("scan", total_files, total_files)
+        cache = None
+        if cache_dir:
+            cache = OutputCache(cache_dir, cache_max_bytes)
+            frames_hash = hash_frames(input_folder, files, cache_key)
+            for output_file in output_files:
+                keys[output_file] = cache.make_key(frames_hash, os.path.splitext(output_file)[1],
+                                                   _cache_settings(output_file, fps, quality, width,
+                                                                   dedupe=dedupe_threshold, **encoder_options))
+                if cache.fetch(keys[output_file], output_file):
+                    print(f"Cache hit: reused cached output for {output_file}.")
+                    results[output_file] = {"format": get_format_name(output_file), "size": os.path.getsize(output_file),
+                                            "seconds": 0.0, "cached": True, "timings": None, "error": None}
+                else:
+                    _prepare_output(cache, output_file)
+
+        pending = [f for f in output_files if f not in results]
+        if not pending:
+            return results
+
+        ceiling = estimate_buffer_bytes(input_folder, files, width)
+        print(f"Buffering {total_files} frames for {len(output_files)} outputs (~{ceiling / (1024 * 1024):.0f} MB).")
+
+        start = time.perf_counter()
+        images = list(open_frames(input_folder, files, width, workers=workers, use_processes=use_processes,
+                                  frame_cache_dir=frame_cache_dir, frame_cache_max_bytes=frame_cache_max_bytes,
+                                  instrument=instrument))
+        print(f"Decoded {total_files} frames in {time.perf_counter() - start:.2f}s.")
+    except Cancelled:
+        _remove_cancelled_outputs(stamps)
+        return False
+    except Exception as e:
+        print(f"Error during conversion: {e}")
+        return False
+
+    # Held frames are collapsed once and shared by every variable-duration output
+    collapsed = (images, None)
+    if dedupe_threshold is not None and any(not format_for_path(f).streaming for f in pending):
+        collapsed = dedupe_frames(images, int(1000 / fps), dedupe_threshold)
+
+    def encode(output_file):
+        result = {"format": get_format_name(output_file), "size": None, "seconds": 0.0, "cached": False,
+                  "timings": None, "error": None}
+        start = time.perf_counter()
+        try:
+            frames, durations = (images, None) if is_streaming(result["format"]) else collapsed
+            # Image.save stores per-call state on the first frame, so each encoder gets its own copy.
+            result["timings"] = write_output([as_image(frames[0]).copy()] + frames[1:], output_file, fps, quality,
+                                             durations, instrument, **encoder_options)
+            result["size"] = os.path.getsize(output_file)
+            if cache:
+                with instrument.stage("write"):
+                    cache.store(keys[output_file], output_file)
+            instrument.emit("write", total_files, total_files, bytes_written=result["size"], output=output_file)
+        except Exception as e:
+            result["error"] = str(e)
+            print(f"Error writing {output_file}: {e}")
+        result["seconds"] = time.perf_counter() - start
+        return result
+
+    try:
+        with ThreadPoolExecutor(max_workers=len(pending)) as pool:
+            results.update(zip(pending, pool.map(encode, pending)))
+    except Cancelled:
+        _remove_cancelled_outputs(stamps)
+        return False
+
+    print("Conversion complete!")
+    return {f: results[f] for f in output_files}
+
+
+def _rgb_frames(frames, width):
+    # Checks and normalizes in-memory frames to RGB/RGBA uint8, resizing to `width` if smaller
+    import numpy as np
+
+    for frame in frames:
+        if isinstance(frame, Image.Image):
+            if frame.mode not in ("RGB", "RGBA"):
+                frame = frame.convert("RGBA")
+            if width and width < frame.width:
+                frame = resize_frame(frame, width)
+        else:
+            frame = np.asarray(frame)
+            if frame.dtype != np.uint8 or frame.ndim != 3 or frame.shape[2] not in (3, 4):
+                raise ValueError(f"frames must be HxWx3 or HxWx4 uint8 arrays, got {frame.dtype} {frame.shape}")
+            if width and width < frame.shape[1]:
+                frame = np.asarray(resize_frame(Image.fromarray(frame), width))
+        yield frame
+
+
+def encode_frames(frames, output_format="webm", fps=24, quality=85, width=None, output=None, durations=None,
+                  dedupe_threshold=None, crf=None, instrument=None, **options):
+    """
+    Encodes in-memory frames without reading or writing any image files.
+
+    Frames are passed to the encoders as they are: NumPy arrays are not copied, and
+    nothing goes through PNG or temporary files. WebM and MOV are streamed through
+    ffmpeg's pipes while `frames` is consumed (MOV is written fragmented, as a stream
+    cannot be rewound); AVIF, GIF and APNG collect every frame first, as Pillow needs them.
+
+    Args:
+        frames (iterable): HxWx3/HxWx4 uint8 NumPy arrays or PIL Images.
+        output_format (str): A format name or alias ("avif", "webm", "mov", "gif", "apng"; see `formats`).
+        fps (int): Frames per second.
+        quality (int): Quality (0-100) for AVIF.
+        width (int): Target width for resizing (optional).
+        output: Writable binary file object (optional); by default the bytes are returned.
+        durations (list): Per-frame durations in milliseconds for AVIF/GIF/APNG (optional).
+        dedupe_threshold (float): Collapse held frames for AVIF/GIF/APNG; see `convert_images`.
+        crf (int): WebM constant quality (0-63, lower is better).
+        instrument (Instrumentation): Receives encode timings and events (optional).
+        **options: Encoder options for AVIF/GIF/APNG (dirty_rects, gif_palette, ...).
+
+    Returns:
+        bytes: The encoded output if `output` is None, otherwise the number of bytes written.
+    """
+    try:
+        format_name = get_format(output_format).name
+    except KeyError as e:
+        raise ValueError(e.args[0]) from None
+    if instrument is None:
+        instrument = Instrumentation()
+    target = io.BytesIO() if output is None else output
+    start = _output_size(target) or 0
+
+    frames = _rgb_frames(frames, width)
+    if not is_streaming(format_name):
+        frames = list(frames)
+        if not frames:
+            raise ValueError("no frames to encode")
+        if dedupe_threshold is not None:
+            from optimize import collapse_duplicates
+            frames, durations = collapse_duplicates(frames, durations or int(1000 / fps), dedupe_threshold)
+    write_output(frames, target, fps, quality, durations, instrument, crf=crf, format_name=format_name, **options)
+
+    if output is None:
+        return target.getvalue()
+    return (_output_size(target) or 0) - start
+
+
+def outputs_for_formats(output_file, formats):
+    """
+    Derives one output path per format name (e.g. "avif,webm,gif") from a base path.
+    """
+    base, _ = os.path.splitext(output_file)
+    outputs = []
+    for name in formats.split(","):
+        name = name.strip().lower()
+        if not name:
+            continue
+        extensions = extension_map()
+        if name not in extensions:
+            raise ValueError(f"Unknown format '{name}'. Choose from: {', '.join(extensions)}.")
+        path = base + extensions[name]
+        if path not in outputs:
+            outputs.append(path)
+    return outputs
+
+def parse_bytes(text):
+    """
+    Parses a byte count with an optional K/M/G suffix (powers of 1024), e.g. "800K".
+    """
+    units = {"K": 1024, "M": 1024 ** 2, "G": 1024 ** 3}
+    text = text.strip().upper().rstrip("B")
+    if text and text[-1] in units:
+        return int(float(text[:-1]) * units[text[-1]])
+    return int(text)
+
+def print_cache_stats(cache_dir):
+    if not cache_dir:
+        return
+    stats = OutputCache(cache_dir).stats()
+    print(f"Cache: {stats['hits']} hits, {stats['misses']} misses, "
+          f"{stats['entries']} entries ({stats['bytes'] / (1024 * 1024):.1f} MB)")
+
 # Alias for backward compatibility if needed, though we will update gui.py
 convert_images_to_avif = convert_images
 
@@ -147,14 +1033,149 @@ def main():
     parser.add_argument("--fps", type=int, default=24, help="Frames per second (default: 24).")
     parser.add_argument("--quality", type=int, default=85, help="Quality (0-100) (default: 85).")
     parser.add_argument("--width", type=int, help="Target width for resizing.")
+    parser.add_argument("--formats",
+                        help="Comma-separated formats to write from one decode (e.g. avif,webm,gif). "
+                             "Output paths reuse the output file name with each format's extension.")
+    parser.add_argument("--cache-dir", help="Reuse outputs of unchanged sequences from this cache directory.")
+    parser.add_argument("--cache-max-mb", type=int, default=DEFAULT_CACHE_MAX_BYTES // (1024 * 1024),
+                        help="Output cache size limit in MB; least recently used entries are evicted (default: 2048).")
+    parser.add_argument("--cache-key", choices=("content", "stat"), default="content",
+                        help="Identify frames by file contents, or by path/size/mtime (faster) (default: content).")
+    parser.add_argument("--frame-cache-dir",
+                        help="Keep decoded frames in a memory-mapped cache here for faster re-runs at other settings.")
+    parser.add_argument("--frame-cache-max-mb", type=int, default=DEFAULT_FRAME_CACHE_MAX_BYTES // (1024 * 1024),
+                        help="Decoded-frame cache size limit in MB; larger sequences are not cached, least recently "
+                             "used entries are evicted (default: 8192).")
+    parser.add_argument("--dedupe", type=float, nargs="?", const=0.0, metavar="THRESHOLD",
+                        help="Merge held frames for AVIF/GIF/APNG. Optional threshold is the max mean pixel "
+                             "difference (0-255) to treat frames as identical (default: 0, exact).")
+    parser.add_argument("--full-frames", action="store_true",
+                        help="Encode full GIF/APNG frames with Pillow instead of only the changed rectangles.")
+    parser.add_argument("--gif-palette", choices=("local", "global"), default="local",
+                        help="GIF palette: one per frame (local) or one shared by the sequence (global) (default: local).")
+    parser.add_argument("--gif-subsample", type=int, default=4,
+                        help="Sample every n-th pixel when building the global GIF palette (default: 4).")
+    parser.add_argument("--gif-dither", action="store_true", help="Ordered dithering for the global GIF palette.")
+    parser.add_argument("--crf", type=int, help="WebM constant quality, 0-63, lower is better (default: libvpx's).")
+    parser.add_argument("--max-bytes", type=parse_bytes, metavar="SIZE",
+                        help="Size budget for AVIF/WebM (e.g. 500000, 800K, 2M): searches the best quality/CRF "
+                             "on a frame subsample, then encodes once.")
+    parser.add_argument("--follow", action="store_true",
+                        help="Convert while frames are still being rendered into the input folder; "
+                             "ends on --expected-frames, --end-marker or --follow-timeout.")
+    parser.add_argument("--expected-frames", type=int, help="With --follow, stop after this many frames.")
+    parser.add_argument("--end-marker", metavar="NAME",
+                        help="With --follow, stop once this file appears in the input folder (e.g. DONE).")
+    parser.add_argument("--follow-timeout", type=float, default=300,
+                        help="With --follow, finish after this many seconds without a new frame (default: 300).")
+    parser.add_argument("--segments", type=int, default=DEFAULT_SEGMENTS,
+                        help="Encode WebM/MOV as this many chunks in parallel ffmpeg processes, then join them "
+                             "without re-encoding (default: 1).")
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS,
+                        help=f"Parallel decode/resize workers (default: {DEFAULT_WORKERS}).")
+    parser.add_argument("--processes", action="store_true", help="Decode in worker processes instead of threads.")
+    parser.add_argument("--frame-window", type=int, default=DEFAULT_FRAME_WINDOW,
+                        help=f"Max decoded frames held in memory when streaming WebM/MOV (default: {DEFAULT_FRAME_WINDOW}).")
+    parser.add_argument("--timings", action="store_true",
+                        help="Print a per-stage timing report (scan/decode/resize/encode/write).")
+    parser.add_argument("--profile", metavar="FILE",
+                        help="Run under cProfile, print the top functions and save the stats to FILE.")
 
     args = parser.parse_args()
 
-    success = convert_images(args.input_folder, args.output_file, args.fps, args.quality, width=args.width)
+    instrument = Instrumentation()
+    if args.profile:
+        with profiled(args.profile):
+            success = run_cli(args, parser, instrument)
+    else:
+        success = run_cli(args, parser, instrument)
+    if args.timings:
+        print(format_report(instrument.report()))
+        print(format_import_timings())
     if not success:
         sys.exit(1)
+
+
+def run_cli(args, parser, instrument):
+    """
+    Runs the conversion described by the parsed command line. Returns True on success.
+    """
+    options = {
+        "cache_dir": args.cache_dir,
+        "cache_max_bytes": args.cache_max_mb * 1024 * 1024,
+        "cache_key": args.cache_key,
+        "frame_cache_dir": args.frame_cache_dir,
+        "frame_cache_max_bytes": args.frame_cache_max_mb * 1024 * 1024,
+        "dedupe_threshold": args.dedupe,
+        "dirty_rects": not args.full_frames,
+        "gif_palette": args.gif_palette,
+        "gif_subsample": args.gif_subsample,
+        "gif_dither": args.gif_dither,
+        "segments": args.segments,
+        "crf": args.crf,
+        "instrument": instrument,
+    }
+
+    if args.follow:
+        if args.formats or args.max_bytes or args.segments > 1:
+            parser.error("--follow cannot be combined with --formats, --max-bytes or --segments")
+        from follow import convert_following
+        success = convert_following(args.input_folder, args.output_file, args.fps, args.quality, width=args.width,
+                                    expected_frames=args.expected_frames, end_marker=args.end_marker,
+                                    timeout=args.follow_timeout, frame_window=args.frame_window,
+                                    workers=args.workers, use_processes=args.processes,
+                                    **{name: options[name] for name in ("crf", "dedupe_threshold", "dirty_rects",
+                                                                        "gif_palette", "gif_subsample", "gif_dither",
+                                                                        "instrument")})
+        if not success:
+            return False
+        print(f"File size: {success} bytes")
+        return True
+
+    if args.max_bytes:
+        if args.formats:
+            parser.error("--max-bytes applies to a single output, not --formats")
+        from budget import convert_to_budget, print_budget_report
+        report = convert_to_budget(args.input_folder, args.output_file, args.max_bytes, args.fps, args.quality,
+                                   width=args.width, frame_window=args.frame_window, workers=args.workers,
+                                   use_processes=args.processes, **options)
+        if not report:
+            return False
+        print_budget_report(report, args.max_bytes)
+        print_cache_stats(args.cache_dir)
+        return report["within_budget"]
+
+    if args.formats:
+        try:
+            outputs = outputs_for_formats(args.output_file, args.formats)
+        except ValueError as e:
+            parser.error(str(e))
+
+        results = convert_multi(args.input_folder, outputs, args.fps, args.quality, width=args.width,
+                                workers=args.workers, use_processes=args.processes, **options)
+        if not results:
+            return False
+
+        for output, result in results.items():
+            if result["size"] is None:
+                print(f"{result['format']:>7}: FAILED ({result['error']}) {output}")
+            elif result["cached"]:
+                print(f"{result['format']:>7}: {result['size']} bytes (cached) -> {output}")
+            else:
+                print(f"{result['format']:>7}: {result['size']} bytes in {result['seconds']:.2f}s -> {output}")
+                print_timings(result["timings"])
+        print_cache_stats(args.cache_dir)
+        return all(result["size"] is not None for result in results.values())
+
+    success = convert_images(args.input_folder, args.output_file, args.fps, args.quality, width=args.width,
+                             frame_window=args.frame_window, workers=args.workers, use_processes=args.processes,
+                             **options)
+    if not success:
+        return False
     
     print(f"File size: {success} bytes")
+    print_cache_stats(args.cache_dir)
+    return True
 
 if __name__ == "__main__":
     main()
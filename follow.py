@@ -0,0 +1,130 @@
+import os
+import time
+from itertools import chain
+
+from convert import (DEFAULT_FRAME_WINDOW, DEFAULT_WORKERS, dedupe_frames, get_format_name, is_streaming,
+                     iter_frames, write_output, write_video)
+from instrument import Instrumentation
+from preflight import is_complete_png, list_frames, natural_key
+
+# Seconds between folder scans while waiting for frames.
+DEFAULT_POLL_INTERVAL = 0.5
+
+# Give up waiting after this many seconds without a new frame.
+DEFAULT_FOLLOW_TIMEOUT = 300
+
+
+def follow_frames(input_folder, expected_frames=None, end_marker=None, poll_interval=DEFAULT_POLL_INTERVAL,
+                  timeout=DEFAULT_FOLLOW_TIMEOUT):
+    """
+    Yields the PNG file names of a folder that is still being rendered into, in natural order.
+
+    A frame is yielded once it is complete and every frame sorting before it has been
+    yielded. Frames that show up after a later-sorting frame was already used are skipped
+    with a warning. Following stops after `expected_frames` frames, once the `end_marker`
+    file exists and every frame listed after it appeared has been yielded, or after
+    `timeout` seconds without a new frame.
+    """
+    last = None
+    used = set()
+    skipped = set()
+    last_new_frame = time.monotonic()
+    while True:
+        # Check the marker before listing, so frames written before it are not missed
+        finished = bool(end_marker) and os.path.exists(os.path.join(input_folder, end_marker))
+        files = list_frames(input_folder)
+
+        waiting = False
+        for name in files:
+            if name in used or name in skipped:
+                continue
+            if last is not None and natural_key(name) < natural_key(last):
+                skipped.add(name)
+                print(f"Warning: skipping '{name}', which arrived after later frames were encoded.")
+                continue
+            if not is_complete_png(os.path.join(input_folder, name)):
+                waiting = True
+                break
+            yield name
+            last = name
+            used.add(name)
+            last_new_frame = time.monotonic()
+            if expected_frames and len(used) >= expected_frames:
+                return
+
+        if finished and not waiting:
+            return
+        if timeout and time.monotonic() - last_new_frame > timeout:
+            print(f"Warning: no new frame for {timeout}s; finishing with {len(used)} frames.")
+            return
+        time.sleep(poll_interval)
+
+
+def convert_following(input_folder, output_file, fps=24, quality=85, width=None, expected_frames=None,
+                      end_marker=None, poll_interval=DEFAULT_POLL_INTERVAL, timeout=DEFAULT_FOLLOW_TIMEOUT,
+                      progress_callback=None, frame_window=DEFAULT_FRAME_WINDOW, workers=DEFAULT_WORKERS,
+                      use_processes=False, crf=None, dedupe_threshold=None, instrument=None, **options):
+    """
+    Converts a PNG sequence while it is still being rendered.
+
+    Frames are decoded as they land (see `follow_frames`). WebM and Safari outputs are
+    encoded incrementally, so when the last frame arrives only the decode window and the
+    encoder flush remain. AVIF, GIF and APNG still need every frame and are encoded at the end.
+    The output and frame caches are not used, as the sequence is unknown up front.
+
+    Args:
+        input_folder (str): Folder the renderer writes PNG frames into.
+        output_file (str): Path to the output file (extension determines format).
+        expected_frames (int): Stop after this many frames (optional).
+        end_marker (str): File name whose appearance in the folder ends the sequence (optional).
+        poll_interval (float): Seconds between folder scans.
+        timeout (float): Finish after this many seconds without a new frame.
+        crf (int): WebM constant quality; see `convert.convert_images`.
+        dedupe_threshold (float): Held-frame threshold for AVIF/GIF/APNG; see `convert.convert_images`.
+        **options: Encoder options for AVIF/GIF/APNG (dirty_rects, gif_palette, ...).
+
+    Returns:
+        int: The output size in bytes, or False on failure.
+    """
+    if not os.path.isdir(input_folder):
+        print(f"Error: Folder '{input_folder}' not found.")
+        return False
+    if instrument is None:
+        instrument = Instrumentation(progress_callback)
+    elif progress_callback:
+        instrument.progress_callback = progress_callback
+
+    format_name = get_format_name(output_file)
+    ending = [f"{expected_frames} frames" if expected_frames else None,
+              f"'{end_marker}'" if end_marker else None, f"{timeout}s without new frames" if timeout else None]
+    print(f"Following {input_folder} until {' or '.join(e for e in ending if e) or 'interrupted'}...")
+    print(f"FPS: {fps}, Quality: {quality}, Width: {width if width else 'Original'}, Format: {format_name}")
+
+    names = follow_frames(input_folder, expected_frames, end_marker, poll_interval, timeout)
+    frames = iter_frames(input_folder, names, width, frame_window, workers=workers, use_processes=use_processes,
+                         instrument=instrument)
+    try:
+        first = next(frames, None)
+        if first is None:
+            print("No frames arrived.")
+            return False
+        frames = chain([first], frames)
+
+        if is_streaming(format_name):
+            write_video(frames, output_file, fps, format_name, instrument, total=expected_frames, crf=crf)
+        else:
+            images = list(frames)
+            print(f"Encoding {len(images)} frames as {format_name}...")
+            durations = None
+            if dedupe_threshold is not None:
+                images, durations = dedupe_frames(images, int(1000 / fps), dedupe_threshold)
+            write_output(images, output_file, fps, quality, durations, instrument, **options)
+
+        size = os.path.getsize(output_file)
+        instrument.emit("write", None, None, bytes_written=size, output=output_file)
+        print("Conversion complete!")
+        return size
+
+    except Exception as e:
+        print(f"Error during conversion: {e}")
+        return False
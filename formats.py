@@ -0,0 +1,158 @@
+import os
+import time
+import importlib
+import threading
+
+# Module -> seconds its first import took, for every backend imported through `load_backend`.
+_import_times = {}
+_import_lock = threading.Lock()
+
+_formats = {}
+
+
+class OutputFormat:
+    """
+    An output format: how it is recognized, what it supports and which modules encode it.
+
+    Args:
+        name (str): Internal name used throughout convert.py ("AVIF", "WebM", ...).
+        label (str): Display name (GUI tabs, file dialogs).
+        extensions (tuple): File extensions, the first one being the default.
+        aliases (tuple): Names accepted by --formats, batch --format and the server.
+        alpha (bool): Keeps transparency.
+        variable_durations (bool): Frames can have individual durations (held frames are collapsed).
+        streaming (bool): The encoder takes frames one at a time instead of a full list.
+        options (tuple): Encoder options (keyword arguments of `convert_images`) that apply.
+        modules (tuple): Modules the encoder needs, imported on first use.
+        content_type (str): MIME type of the output.
+        description (str): One line about the format.
+        encoder (callable): For formats registered from outside: called by `write_output` as
+            encoder(images, output_file, fps, quality, durations, instrument, **options).
+    """
+
+    def __init__(self, name, label, extensions, aliases=(), alpha=True, variable_durations=False, streaming=False,
+                 options=(), modules=(), content_type="application/octet-stream", description="", encoder=None):
+        self.name = name
+        self.label = label
+        self.extensions = tuple(extensions)
+        self.aliases = tuple(aliases)
+        self.alpha = alpha
+        self.variable_durations = variable_durations
+        self.streaming = streaming
+        self.options = tuple(options)
+        self.modules = tuple(modules)
+        self.content_type = content_type
+        self.description = description
+        self.encoder = encoder
+
+    @property
+    def extension(self):
+        return self.extensions[0]
+
+    def __repr__(self):
+        return f"OutputFormat({self.name!r}, extensions={self.extensions})"
+
+
+def register_format(output_format):
+    """
+    Adds (or replaces) a format; its extensions and aliases take precedence over earlier formats.
+    """
+    _formats[output_format.name] = output_format
+    return output_format
+
+
+def formats():
+    """
+    Returns every registered format, in registration order.
+    """
+    return list(_formats.values())
+
+
+def get_format(name):
+    """
+    Looks a format up by name or alias (case-insensitive). Raises KeyError if unknown.
+    """
+    if name in _formats:
+        return _formats[name]
+    key = name.lower()
+    for output_format in reversed(formats()):
+        if key == output_format.name.lower() or key in output_format.aliases:
+            return output_format
+    raise KeyError(f"Unknown format '{name}'. Choose from: {', '.join(extension_map())}.")
+
+
+def format_for_path(path, default="AVIF"):
+    """
+    Picks the format of an output path by its extension, or `default` if none matches.
+    """
+    ext = os.path.splitext(path)[1].lower()
+    for output_format in reversed(formats()):
+        if ext in output_format.extensions:
+            return output_format
+    return _formats[default]
+
+
+def extension_map():
+    """
+    Returns {alias: default extension} for every alias of every format.
+    """
+    return {alias: output_format.extension for output_format in formats() for alias in output_format.aliases}
+
+
+def load_backend(name):
+    """
+    Imports the modules a format's encoder needs (once per process) and returns the format.
+    """
+    output_format = get_format(name)
+    for module in output_format.modules:
+        if module in _import_times:
+            continue
+        with _import_lock:
+            if module in _import_times:
+                continue
+            start = time.perf_counter()
+            importlib.import_module(module)
+            _import_times[module] = time.perf_counter() - start
+    return output_format
+
+
+def import_timings():
+    """
+    Returns {module: seconds} for the backends imported so far, in import order. A module
+    that an earlier backend already pulled in (e.g. numpy via imageio) shows up as ~0s.
+    """
+    return dict(_import_times)
+
+
+def format_import_timings(timings=None):
+    timings = import_timings() if timings is None else timings
+    if not timings:
+        return "Backend imports: none"
+    return "Backend imports: " + ", ".join(f"{module} {seconds:.3f}s" for module, seconds in timings.items())
+
+
+register_format(OutputFormat(
+    "AVIF", "AVIF", (".avif",), aliases=("avif",), variable_durations=True,
+    options=("quality",), modules=("pillow_avif",), content_type="image/avif",
+    description="AV1 image sequence.",
+))
+register_format(OutputFormat(
+    "WebM", "WebM", (".webm",), aliases=("webm",), streaming=True,
+    options=("crf", "segments"), modules=("numpy", "imageio", "imageio_ffmpeg"), content_type="video/webm",
+    description="VP9 video with alpha. Quality is libvpx's default unless a CRF is set.",
+))
+register_format(OutputFormat(
+    "Safari", "Safari (ProRes)", (".mov",), aliases=("mov", "safari", "prores"), streaming=True,
+    options=("segments",), modules=("numpy", "imageio", "imageio_ffmpeg"), content_type="video/quicktime",
+    description="ProRes 4444 with alpha. Best for transparency in Safari.",
+))
+register_format(OutputFormat(
+    "GIF", "GIF", (".gif",), aliases=("gif",), variable_durations=True,
+    options=("dirty_rects", "gif_palette", "gif_subsample", "gif_dither"), modules=("numpy", "optimize"),
+    content_type="image/gif", description="Animated GIF with 1-bit transparency.",
+))
+register_format(OutputFormat(
+    "PNG", "APNG", (".png",), aliases=("apng", "png"), variable_durations=True,
+    options=("dirty_rects",), modules=("numpy", "optimize"), content_type="image/apng",
+    description="Animated PNG, lossless.",
+))
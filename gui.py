@@ -1,9 +1,14 @@
 import tkinter as tk
 from tkinter import filedialog, messagebox, ttk
 import threading
+import time
 import os
-from PIL import Image
-from convert import convert_images
+from PIL import ImageTk
+from cache import DEFAULT_FRAME_CACHE_DIR
+from formats import formats
+from jobs import DEFAULT_CONCURRENT_JOBS, DONE, FAILED, ConversionQueue
+from preflight import scan_frames, scan_problems
+from preview import DEFAULT_THUMBNAIL_SIZE, PreviewLoader, ThumbnailCache
 
 class AVIFConverterGUI:
     def __init__(self, root):
@@ -18,9 +23,28 @@ class AVIFConverterGUI:
         self.fps = tk.IntVar(value=24)
         self.quality = tk.IntVar(value=85)
         self.width = tk.IntVar(value=0)
+        self.cache_frames = tk.BooleanVar(value=False)
         self.status_var = tk.StringVar(value="Ready")
 
+        # Preview state: thumbnails survive folder changes, the loader is per folder
+        self.preview_info = tk.StringVar(value="")
+        self.preview_index = tk.IntVar(value=0)
+        self.preview_position = None
+        self.preview_cache = ThumbnailCache()
+        self.preview_loader = None
+        self.preview_photo = None
+        self.playing = False
+        self.play_start = None
+        self.play_job = None
+
+        # Job queue: jobs report from their worker threads, rows are updated in the main loop
+        self.job_workers = tk.IntVar(value=DEFAULT_CONCURRENT_JOBS)
+        self.queue = ConversionQueue(DEFAULT_CONCURRENT_JOBS,
+                                     on_change=lambda job: self.root.after(0, lambda: self.update_job(job)))
+        self.reported_jobs = set()
+
         self.create_widgets()
+        self.root.protocol("WM_DELETE_WINDOW", self.on_close)
 
     class ToolTip(object):
         def __init__(self, widget, text='widget info'):
@@ -71,8 +95,14 @@ class AVIFConverterGUI:
                 tw.destroy()
 
     def create_widgets(self):
+        # Status
+        tk.Label(self.root, textvariable=self.status_var, relief="sunken", anchor="w").pack(side="bottom", fill="x")
+
+        # Everything else scrolls, so the window also fits on short screens
+        body = self.create_scrollable_body()
+
         # Input Section
-        input_group = tk.LabelFrame(self.root, text="Input", padx=10, pady=10)
+        input_group = tk.LabelFrame(body, text="Input", padx=10, pady=10)
         input_group.pack(fill="x", padx=10, pady=5)
         
         tk.Label(input_group, text="Folder (PNG Sequence):").pack(anchor="w")
@@ -82,8 +112,31 @@ class AVIFConverterGUI:
         tk.Entry(input_frame, textvariable=self.input_folder, state="readonly").pack(side="left", fill="x", expand=True)
         tk.Button(input_frame, text="Browse", command=self.browse_input).pack(side="right", padx=5)
 
+        # Preview Section
+        preview_group = tk.LabelFrame(body, text="Preview", padx=10, pady=5)
+        preview_group.pack(fill="x", padx=10, pady=5)
+
+        # Fixed-size area, so the layout does not jump as thumbnails arrive
+        preview_area = tk.Frame(preview_group, width=DEFAULT_THUMBNAIL_SIZE[0], height=DEFAULT_THUMBNAIL_SIZE[1])
+        preview_area.pack(pady=5)
+        preview_area.pack_propagate(False)
+        self.preview_label = tk.Label(preview_area, text="Select a folder to preview frames.")
+        self.preview_label.pack(fill="both", expand=True)
+
+        self.preview_scale = tk.Scale(preview_group, from_=0, to=0, orient="horizontal", showvalue=False,
+                                      variable=self.preview_index, command=self.on_scrub, state="disabled")
+        self.preview_scale.pack(fill="x")
+        self.ToolTip(self.preview_scale, "Scrub through the sequence.")
+
+        preview_controls = tk.Frame(preview_group)
+        preview_controls.pack(fill="x")
+        self.play_btn = tk.Button(preview_controls, text="Play", width=6, command=self.toggle_play, state="disabled")
+        self.play_btn.pack(side="left")
+        self.ToolTip(self.play_btn, "Play the preview at the FPS setting.")
+        tk.Label(preview_controls, textvariable=self.preview_info, anchor="w").pack(side="left", fill="x", padx=5)
+
         # Settings Section
-        settings_group = tk.LabelFrame(self.root, text="Settings", padx=10, pady=10)
+        settings_group = tk.LabelFrame(body, text="Settings", padx=10, pady=10)
         settings_group.pack(fill="both", expand=True, padx=10, pady=5)
 
         # Shared Settings
@@ -101,6 +154,11 @@ class AVIFConverterGUI:
         self.width_scale = tk.Scale(shared_frame, from_=1, to=100, orient="horizontal", variable=self.width, state="disabled")
         self.width_scale.grid(row=1, column=1, sticky="we", padx=5, pady=5)
         self.ToolTip(self.width_scale, "Width of the output. Disabled until input folder is selected.")
+
+        # Frame cache
+        cache_check = tk.Checkbutton(shared_frame, text="Cache decoded frames", variable=self.cache_frames)
+        cache_check.grid(row=2, column=0, columnspan=2, sticky="w", padx=5)
+        self.ToolTip(cache_check, "Keep decoded frames on disk so re-runs with other FPS/quality settings skip decoding.")
         
         shared_frame.columnconfigure(1, weight=1)
 
@@ -108,31 +166,21 @@ class AVIFConverterGUI:
         self.notebook = ttk.Notebook(settings_group)
         self.notebook.pack(pady=10, fill="both", expand=True)
 
-        # Create Tab Frames
-        self.avif_tab = tk.Frame(self.notebook)
-        self.webm_tab = tk.Frame(self.notebook)
-        self.safari_tab = tk.Frame(self.notebook)
-        self.gif_tab = tk.Frame(self.notebook)
-        self.png_tab = tk.Frame(self.notebook)
-
-        self.notebook.add(self.avif_tab, text="AVIF")
-        self.notebook.add(self.webm_tab, text="WebM")
-        self.notebook.add(self.safari_tab, text="Safari (ProRes)")
-        self.notebook.add(self.gif_tab, text="GIF")
-        self.notebook.add(self.png_tab, text="APNG")
-        
-        # Populate Tabs
-        self.create_avif_settings(self.avif_tab)
-        tk.Label(self.webm_tab, text="Use Shared Settings (VP9).\nQuality slider maps to CRF.").pack(pady=20)
-        tk.Label(self.safari_tab, text="Use Shared Settings (ProRes 4444).\nBest for transparency in Safari.").pack(pady=20)
-        tk.Label(self.gif_tab, text="Use Shared Settings.").pack(pady=20)
-        tk.Label(self.png_tab, text="Use Shared Settings.").pack(pady=20)
+        # One tab per registered output format
+        self.tab_formats = formats()
+        for output_format in self.tab_formats:
+            tab = tk.Frame(self.notebook)
+            self.notebook.add(tab, text=output_format.label)
+            if "quality" in output_format.options:
+                self.create_avif_settings(tab)
+            else:
+                tk.Label(tab, text=f"Use Shared Settings.\n{output_format.description}").pack(pady=20)
 
         # Bind tab change
         self.notebook.bind("<<NotebookTabChanged>>", self.on_tab_change)
 
         # Output Section
-        output_group = tk.LabelFrame(self.root, text="Output", padx=10, pady=10)
+        output_group = tk.LabelFrame(body, text="Output", padx=10, pady=10)
         output_group.pack(fill="x", padx=10, pady=5)
 
         tk.Label(output_group, text="Destination File:").pack(anchor="w")
@@ -143,7 +191,7 @@ class AVIFConverterGUI:
         tk.Button(output_frame_inner, text="Browse", command=self.browse_output).pack(side="right", padx=5)
 
         # Actions
-        action_frame = tk.Frame(self.root)
+        action_frame = tk.Frame(body)
         action_frame.pack(fill="x", padx=20, pady=10)
 
         self.convert_btn = tk.Button(action_frame, text="Convert", command=self.start_conversion, height=2, bg="#4CAF50", fg="white", font=("Arial", 12, "bold"))
@@ -152,8 +200,56 @@ class AVIFConverterGUI:
         self.open_btn = tk.Button(action_frame, text="Open Folder", command=self.open_output_folder, state="disabled", height=2)
         self.open_btn.pack(side="right", padx=(10, 0))
 
-        # Status
-        tk.Label(self.root, textvariable=self.status_var, relief="sunken", anchor="w").pack(side="bottom", fill="x")
+        # Jobs Section
+        jobs_group = tk.LabelFrame(body, text="Jobs", padx=10, pady=5)
+        jobs_group.pack(fill="x", padx=10, pady=5)
+
+        self.jobs_tree = ttk.Treeview(jobs_group, columns=("output", "status", "progress"), show="headings", height=4)
+        self.jobs_tree.heading("output", text="Output")
+        self.jobs_tree.heading("status", text="Status")
+        self.jobs_tree.heading("progress", text="Progress")
+        self.jobs_tree.column("output", width=240)
+        self.jobs_tree.column("status", width=90)
+        self.jobs_tree.column("progress", width=70, anchor="e")
+        self.jobs_tree.pack(fill="x")
+
+        jobs_controls = tk.Frame(jobs_group)
+        jobs_controls.pack(fill="x", pady=(5, 0))
+        tk.Label(jobs_controls, text="Workers:").pack(side="left")
+        workers_spin = tk.Spinbox(jobs_controls, from_=1, to=os.cpu_count() or 1, width=3,
+                                  textvariable=self.job_workers, command=self.on_workers_change)
+        workers_spin.pack(side="left", padx=5)
+        workers_spin.bind("<Return>", self.on_workers_change)
+        workers_spin.bind("<FocusOut>", self.on_workers_change)
+        self.ToolTip(workers_spin, "Number of conversions run at once. Each one already decodes on several threads.")
+        tk.Button(jobs_controls, text="Clear Finished", command=self.clear_finished_jobs).pack(side="right")
+        tk.Button(jobs_controls, text="Cancel", command=self.cancel_selected_jobs).pack(side="right", padx=5)
+
+        # Open as tall as the content, as far as the screen allows
+        self.root.update_idletasks()
+        height = min(body.winfo_reqheight() + 30, self.root.winfo_screenheight() - 100)
+        self.root.geometry(f"500x{max(600, height)}")
+
+    def create_scrollable_body(self):
+        canvas = tk.Canvas(self.root, highlightthickness=0)
+        scrollbar = tk.Scrollbar(self.root, orient="vertical", command=canvas.yview)
+        canvas.configure(yscrollcommand=scrollbar.set)
+        scrollbar.pack(side="right", fill="y")
+        canvas.pack(side="left", fill="both", expand=True)
+
+        body = tk.Frame(canvas)
+        window = canvas.create_window((0, 0), window=body, anchor="nw")
+        body.bind("<Configure>", lambda e: canvas.configure(scrollregion=canvas.bbox("all")))
+        canvas.bind("<Configure>", lambda e: canvas.itemconfigure(window, width=e.width))
+
+        def scroll(units):
+            if body.winfo_height() > canvas.winfo_height():
+                canvas.yview_scroll(units, "units")
+
+        self.root.bind_all("<MouseWheel>", lambda e: scroll(-1 if e.delta > 0 else 1))
+        self.root.bind_all("<Button-4>", lambda e: scroll(-1))
+        self.root.bind_all("<Button-5>", lambda e: scroll(1))
+        return body
 
     def create_avif_settings(self, parent):
         frame = tk.Frame(parent)
@@ -163,7 +259,7 @@ class AVIFConverterGUI:
         tk.Label(frame, text="Quality (0-100):").grid(row=0, column=0, sticky="w", padx=5, pady=5)
         q_scale = tk.Scale(frame, from_=0, to=100, orient="horizontal", variable=self.quality)
         q_scale.grid(row=0, column=1, sticky="we", padx=5, pady=5)
-        self.ToolTip(q_scale, "0=Low, 100=High. For WebM/Safari, this maps to CRF.")
+        self.ToolTip(q_scale, "0=Low, 100=High. Used by AVIF; WebM and Safari keep their encoder defaults.")
         
         frame.columnconfigure(1, weight=1)
 
@@ -201,70 +297,135 @@ class AVIFConverterGUI:
             self.scan_folder_for_width(folder)
 
     def scan_folder_for_width(self, folder):
+        # Check every frame's header in the background; large folders must not freeze the window
+        self.status_var.set("Checking frames...")
+        threading.Thread(target=self._scan_folder, args=(folder,), daemon=True).start()
+
+    def _scan_folder(self, folder):
         try:
-            files = [f for f in os.listdir(folder) if f.lower().endswith('.png')]
-            files.sort()
-            if files:
-                first_img_path = os.path.join(folder, files[0])
-                img = Image.open(first_img_path)
-                width = img.width
-                
-                self.width_scale.config(from_=1, to=width, state="normal")
-                self.width.set(width)
-            else:
-                self.width_scale.config(state="disabled")
+            report = scan_frames(folder)
         except Exception as e:
             print(f"Error scanning folder: {e}")
+            report = None
+        self.root.after(0, lambda: self._apply_scan(folder, report))
+
+    def _apply_scan(self, folder, report):
+        if folder != self.input_folder.get():
+            return  # Another folder was picked meanwhile
+        if not report or report["width"] is None:
             self.width_scale.config(state="disabled")
+            self.status_var.set("No readable PNG frames found." if report else "Error scanning folder.")
+            return
+
+        width = report["width"]
+        self.width_scale.config(from_=1, to=width, state="normal")
+        self.width.set(width)
+        self.load_preview(folder, report["files"], report["stats"])
+
+        errors, warnings = scan_problems(report)
+        if errors or warnings:
+            self.status_var.set((errors + warnings)[0])
+            if errors:
+                messagebox.showwarning("Frame Check", "\n\n".join(errors + warnings))
+        else:
+            self.status_var.set(f"{len(report['files'])} frames, {width}x{report['height']} {report['mode']}.")
+
+    def load_preview(self, folder, files, stats=None):
+        self.stop_preview()
+        if self.preview_loader:
+            self.preview_loader.close()
+        loader = PreviewLoader(folder, files, self.preview_cache, stats=stats)
+        # Thumbnails are decoded on the loader's thread; only show them from the main loop
+        loader.on_ready = lambda index: self.root.after(0, lambda: self.show_preview(index, loader))
+        self.preview_loader = loader
+        self.preview_position = None
+        self.preview_scale.config(from_=0, to=len(files) - 1, state="normal")
+        self.play_btn.config(state="normal")
+        self.seek_preview(0)
+
+    def on_scrub(self, value):
+        index = int(float(value))
+        if index == self.preview_position:
+            return
+        if self.playing:
+            # Carry on playing from where the scrubber was dropped
+            self.play_start = (time.perf_counter(), index, self.fps.get())
+        self.seek_preview(index)
+
+    def seek_preview(self, index):
+        self.preview_position = index
+        self.preview_index.set(index)
+        self.preview_loader.request(index)
+        self.show_preview(index)
+
+    def show_preview(self, index, loader=None):
+        if loader is not None and loader is not self.preview_loader:
+            return  # A thumbnail of a previous folder
+        loader = self.preview_loader
+        if loader is None or index != self.preview_position:
+            return
+
+        fps = max(1, self.fps.get())
+        self.preview_info.set(f"Frame {index + 1}/{len(loader.files)}  {index / fps:.2f}s  {loader.files[index]}")
+        img = loader.get(index)
+        if img is not None:
+            self.preview_photo = ImageTk.PhotoImage(img)
+            self.preview_label.config(image=self.preview_photo, text="")
+        elif index in loader.errors:
+            self.preview_photo = None
+            self.preview_label.config(image="", text=f"Cannot preview: {loader.errors[index]}")
+        # Otherwise the previous frame stays up until the thumbnail is ready
+
+    def toggle_play(self):
+        if self.playing:
+            self.stop_preview()
+            return
+        self.playing = True
+        self.play_btn.config(text="Pause")
+        self.play_start = (time.perf_counter(), self.preview_position or 0, self.fps.get())
+        self.play_tick()
+
+    def play_tick(self):
+        if not self.playing or self.preview_loader is None:
+            return
+        start, first, fps = self.play_start
+        if fps != self.fps.get():
+            # FPS changed while playing: continue from the current frame at the new rate
+            start, first, fps = self.play_start = (time.perf_counter(), self.preview_position, self.fps.get())
+        fps = max(1, fps)
+
+        # Frames follow the clock, so slow thumbnails hold a frame instead of slowing playback down
+        elapsed = int((time.perf_counter() - start) * fps)
+        index = (first + elapsed) % len(self.preview_loader.files)
+        if index != self.preview_position:
+            self.seek_preview(index)
+        next_due = start + (elapsed + 1) / fps
+        self.play_job = self.root.after(max(1, int((next_due - time.perf_counter()) * 1000)), self.play_tick)
+
+    def stop_preview(self):
+        self.playing = False
+        if self.play_job:
+            self.root.after_cancel(self.play_job)
+            self.play_job = None
+        self.play_btn.config(text="Play")
 
     def on_tab_change(self, event):
         current_file = self.output_file.get()
         if not current_file:
             return
 
-        current_tab_index = self.notebook.index(self.notebook.select())
-        
+        output_format = self.current_format()
         base, _ = os.path.splitext(current_file)
-        
-        if current_tab_index == 0: # AVIF
-            new_ext = ".avif"
-        elif current_tab_index == 1: # WebM
-            new_ext = ".webm"
-        elif current_tab_index == 2: # Safari
-            new_ext = ".mov"
-        elif current_tab_index == 3: # GIF
-            new_ext = ".gif"
-        elif current_tab_index == 4: # APNG
-            new_ext = ".png"
-        else:
-            return
+        self.output_file.set(base + output_format.extension)
 
-        new_file = base + new_ext
-        self.output_file.set(new_file)
+    def current_format(self):
+        return self.tab_formats[self.notebook.index(self.notebook.select())]
 
     def browse_output(self):
-        # Determine current tab
-        current_tab_index = self.notebook.index(self.notebook.select())
-        
         # Default file types based on tab
-        if current_tab_index == 0: # AVIF
-             filetypes = [("AVIF files", "*.avif")]
-             defaultextension = ".avif"
-        elif current_tab_index == 1: # WebM
-             filetypes = [("WebM files", "*.webm")]
-             defaultextension = ".webm"
-        elif current_tab_index == 2: # Safari
-             filetypes = [("Safari/QuickTime files", "*.mov")]
-             defaultextension = ".mov"
-        elif current_tab_index == 3: # GIF
-             filetypes = [("GIF files", "*.gif")]
-             defaultextension = ".gif"
-        elif current_tab_index == 4: # APNG
-             filetypes = [("APNG files", "*.png")]
-             defaultextension = ".png"
-        else:
-             filetypes = [("All files", "*.*")]
-             defaultextension = ""
+        output_format = self.current_format()
+        filetypes = [(f"{output_format.label} files", " ".join("*" + ext for ext in output_format.extensions))]
+        defaultextension = output_format.extension
 
         # Determine initial directory (parent of input folder)
         initialdir = None
@@ -293,52 +454,75 @@ class AVIFConverterGUI:
             messagebox.showerror("Error", "Please select an output file.")
             return
 
-        self.convert_btn.config(state="disabled", text="Converting...")
-        self.status_var.set("Converting...")
-        
-        # Run in separate thread
-        thread = threading.Thread(target=self.run_conversion, args=(input_folder, output_file))
-        thread.start()
-
-    def update_progress(self, current, total, message):
-        # Schedule GUI updates on the main thread
-        self.root.after(0, lambda: self._update_progress_gui(current, total, message))
+        # Settings are read now, so changing them later does not affect the queued job
+        width = self.width.get()
+        if self.width_scale.cget("state") != "normal" or width == self.width_scale.cget("to"):
+            width = None  # Original width: avoid resizing
 
-    def _update_progress_gui(self, current, total, message):
-        self.status_var.set(message)
-
-    def run_conversion(self, input_folder, output_file):
         try:
-            fps = self.fps.get()
-            quality = self.quality.get()
-            width = self.width.get()
-            
-            # If width is same as max (original), pass None to avoid resizing
-            if self.width_scale.cget("state") == "normal":
-                 original_width = self.width_scale.cget("to")
-                 if width == original_width:
-                     width = None
-            else:
-                width = None
-
-            result = convert_images(
-                input_folder, 
-                output_file, 
-                fps, 
-                quality, 
+            job = self.queue.submit(
+                input_folder,
+                output_file,
+                fps=self.fps.get(),
+                quality=self.quality.get(),
                 width=width,
-                progress_callback=self.update_progress
+                frame_cache_dir=DEFAULT_FRAME_CACHE_DIR if self.cache_frames.get() else None
             )
-            
-            if result:
-                self.root.after(0, lambda: self.conversion_success(result))
-            else:
-                self.root.after(0, lambda: self.conversion_error("Conversion failed. Check console for details."))
-        except Exception as e:
-            self.root.after(0, lambda: self.conversion_error(str(e)))
+        except ValueError as e:
+            messagebox.showerror("Error", str(e))
+            return
+        self.status_var.set(f"Queued {os.path.basename(job.output_file)}.")
+
+    def update_job(self, job):
+        if job.id not in self.queue.jobs:
+            return  # Cleared meanwhile
+        name = os.path.basename(job.output_file)
+        values = (name, job.status.capitalize(), f"{job.progress:.0%}")
+        row = str(job.id)
+        if self.jobs_tree.exists(row):
+            self.jobs_tree.item(row, values=values)
+        else:
+            self.jobs_tree.insert("", "end", iid=row, values=values)
+
+        if job.status == DONE and job.id not in self.reported_jobs:
+            self.reported_jobs.add(job.id)
+            self.conversion_success(job)
+        elif job.status == FAILED and job.id not in self.reported_jobs:
+            self.reported_jobs.add(job.id)
+            self.conversion_error(job)
+        elif not job.finished or job.id not in self.reported_jobs:
+            self.status_var.set(f"{name}: {job.message}")
+
+    def on_workers_change(self, event=None):
+        try:
+            workers = self.job_workers.get()
+        except tk.TclError:
+            return  # Not a number (yet)
+        self.queue.set_workers(workers)
+
+    def cancel_selected_jobs(self):
+        for row in self.jobs_tree.selection():
+            self.queue.cancel(int(row))
+
+    def clear_finished_jobs(self):
+        for job_id in self.queue.clear_finished():
+            self.jobs_tree.delete(str(job_id))
+            self.reported_jobs.discard(job_id)
+
+    def on_close(self):
+        # Running jobs stop at their next frame and remove their partial output; wait for that
+        if self.queue.active():
+            self.queue.shutdown(timeout=0)
+            self.status_var.set("Cancelling jobs...")
+            self.root.after(100, self.on_close)
+            return
+        if self.preview_loader:
+            self.preview_loader.close()
+        self.root.destroy()
 
-    def conversion_success(self, size_bytes):
+    def conversion_success(self, job):
         # Format size
+        size_bytes = job.size
         if size_bytes < 1024:
             size_str = f"{size_bytes} bytes"
         elif size_bytes < 1024 * 1024:
@@ -346,16 +530,12 @@ class AVIFConverterGUI:
         else:
             size_str = f"{size_bytes/(1024*1024):.1f} MB"
 
-        msg = f"Conversion Complete! Size: {size_str}"
-        self.status_var.set(msg)
-        self.convert_btn.config(state="normal", text="Convert")
+        self.status_var.set(f"{os.path.basename(job.output_file)} complete! Size: {size_str}")
         self.open_btn.config(state="normal") # Enable open button
-        messagebox.showinfo("Success", f"Conversion completed successfully!\nFile Size: {size_str}")
 
-    def conversion_error(self, message):
-        self.status_var.set("Error occurred")
-        self.convert_btn.config(state="normal", text="Convert")
-        messagebox.showerror("Error", message)
+    def conversion_error(self, job):
+        self.status_var.set(f"{os.path.basename(job.output_file)}: error occurred")
+        messagebox.showerror("Error", f"{job.output_file}\n\n{job.error}")
 
 if __name__ == "__main__":
     root = tk.Tk()
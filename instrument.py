@@ -0,0 +1,182 @@
+import time
+import threading
+import cProfile
+import pstats
+from collections import namedtuple
+from contextlib import contextmanager
+
+# Pipeline stages, in order
+STAGES = ("scan", "decode", "resize", "encode", "write")
+
+# One structured progress event.
+#   stage: one of STAGES
+#   index/total: frame position within the stage (total may be None)
+#   elapsed: seconds since the conversion started
+#   bytes_written: size of the output so far, when known
+#   message: human readable text, as passed to progress_callback
+#   output: the output file an encode/write event belongs to
+ProgressEvent = namedtuple("ProgressEvent", "stage index total elapsed bytes_written message output",
+                           defaults=(None,))
+
+
+class Cancelled(BaseException):
+    """
+    Raised inside a conversion once its `Instrumentation` has been cancelled.
+
+    Like KeyboardInterrupt it is not an `Exception`, so handlers that report encoder
+    failures let it through to the code that cleans up.
+    """
+
+
+class Instrumentation:
+    """
+    Collects per-stage timings of a conversion and fans out progress events.
+
+    Structured `ProgressEvent`s go to `event_callback`; events that carry a message
+    are also forwarded to the classic `progress_callback(current, total, message)`.
+    Stage times are accumulated with `add`/`stage` and summarized by `report`.
+    Times measured on worker threads (decode, resize) are summed, so they can
+    exceed the wall-clock total.
+
+    `cancel()` may be called from any thread; the conversion then raises `Cancelled`
+    at its next progress event, which every decode and encode loop emits per frame.
+    """
+
+    def __init__(self, progress_callback=None, event_callback=None):
+        self.progress_callback = progress_callback
+        self.event_callback = event_callback
+        self.started = time.perf_counter()
+        self.seconds = {}
+        self.counts = {}
+        self.bytes_written = {}
+        self._lock = threading.Lock()
+        self._cancelled = threading.Event()
+
+    def elapsed(self):
+        return time.perf_counter() - self.started
+
+    def add(self, stage, seconds, count=1):
+        """
+        Adds `seconds` spent in `stage` (thread-safe).
+        """
+        with self._lock:
+            self.seconds[stage] = self.seconds.get(stage, 0.0) + seconds
+            self.counts[stage] = self.counts.get(stage, 0) + count
+
+    @contextmanager
+    def stage(self, name, count=1):
+        """
+        Times the enclosed block as `name`, covering `count` items (e.g. frames).
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - start, count)
+
+    def cancel(self):
+        """
+        Asks the conversion to stop (thread-safe).
+        """
+        self._cancelled.set()
+
+    @property
+    def cancelled(self):
+        return self._cancelled.is_set()
+
+    def check(self):
+        """
+        Raises `Cancelled` if the conversion has been cancelled.
+        """
+        if self._cancelled.is_set():
+            raise Cancelled("conversion cancelled")
+
+    def emit(self, stage, index, total=None, message=None, bytes_written=None, output=None):
+        """
+        Sends a progress event to the callbacks, or raises `Cancelled` if cancelled.
+        """
+        self.check()
+        if bytes_written is not None:
+            self.bytes_written[output] = bytes_written
+        if self.event_callback:
+            self.event_callback(ProgressEvent(stage, index, total, self.elapsed(), bytes_written, message, output))
+        if message and self.progress_callback:
+            self.progress_callback(index, total, message)
+
+    def discard(self, output):
+        """
+        Forgets the bytes written to `output` (e.g. a temporary file that was removed).
+        """
+        self.bytes_written.pop(output, None)
+
+    def report(self):
+        """
+        Returns {"stages": {stage: {"seconds", "count"}}, "total_seconds", "bytes_written"},
+        where "bytes_written" is the latest known size summed over all outputs.
+        """
+        stages = {}
+        for name in STAGES + tuple(sorted(set(self.seconds) - set(STAGES))):
+            if name in self.seconds:
+                stages[name] = {"seconds": self.seconds[name], "count": self.counts[name]}
+        return {"stages": stages, "total_seconds": self.elapsed(), "bytes_written": sum(self.bytes_written.values()) if self.bytes_written else None}
+
+
+class OffsetInstrumentation:
+    """
+    View of an `Instrumentation` for one segment of a sequence processed in parallel.
+
+    Timings add to the parent; event frame indices are shifted by `first_index` and
+    totals replaced by `total`. Per-frame messages are dropped, since interleaved
+    segments would make them jump around; report segment progress on the parent instead.
+    """
+
+    def __init__(self, parent, first_index, total):
+        self.parent = parent
+        self.first_index = first_index
+        self.total = total
+
+    def add(self, stage, seconds, count=1):
+        self.parent.add(stage, seconds, count)
+
+    stage = Instrumentation.stage
+
+    @property
+    def cancelled(self):
+        return self.parent.cancelled
+
+    def check(self):
+        self.parent.check()
+
+    def emit(self, stage, index, total=None, message=None, bytes_written=None, output=None):
+        self.parent.emit(stage, index + self.first_index, self.total, bytes_written=bytes_written, output=output)
+
+
+def format_report(report):
+    """
+    Formats a `Instrumentation.report()` as a small text table.
+    """
+    lines = [f"{'stage':<8} {'seconds':>9} {'count':>6}"]
+    for name, stage in report["stages"].items():
+        lines.append(f"{name:<8} {stage['seconds']:>9.3f} {stage['count']:>6}")
+    lines.append(f"{'total':<8} {report['total_seconds']:>9.3f}")
+    if report["bytes_written"] is not None:
+        lines.append(f"{'bytes':<8} {report['bytes_written']:>9}")
+    return "\n".join(lines)
+
+
+@contextmanager
+def profiled(path=None, sort="cumulative", limit=25):
+    """
+    Runs the enclosed block under cProfile. Stats are dumped to `path` (readable with
+    `python -m pstats`) if given, and the top entries are printed.
+    """
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        yield profiler
+    finally:
+        profiler.disable()
+        if path:
+            profiler.dump_stats(path)
+            print(f"Profile written to {path}")
+        pstats.Stats(profiler).sort_stats(sort).print_stats(limit)
@@ -0,0 +1,219 @@
+import os
+import threading
+
+from convert import convert_images
+from instrument import Instrumentation
+
+# Conversions run at once by default. Each one already decodes on several threads.
+DEFAULT_CONCURRENT_JOBS = 1
+
+# Job states
+QUEUED, RUNNING, CANCELLING, DONE, FAILED, CANCELLED = "queued", "running", "cancelling", "done", "failed", "cancelled"
+FINISHED = (DONE, FAILED, CANCELLED)
+
+
+class ConversionJob:
+    """
+    One conversion in a `ConversionQueue`, with its state and progress.
+
+    `progress` (0-1) counts decoding and encoding as one half each; `message` is the
+    latest progress message of the conversion.
+    """
+
+    def __init__(self, job_id, input_folder, output_file, settings):
+        self.id = job_id
+        self.input_folder = input_folder
+        self.output_file = output_file
+        self.settings = settings
+        self.status = QUEUED
+        self.progress = 0.0
+        self.message = "Queued"
+        self.size = None
+        self.error = None
+        self.instrument = Instrumentation()
+        self._decoded = 0.0
+        self._encoded = 0.0
+
+    @property
+    def finished(self):
+        return self.status in FINISHED
+
+    @property
+    def frame_cache_key(self):
+        """
+        The decoded-frame cache entry this job reads or fills, or None without a frame cache.
+        """
+        frame_cache_dir = self.settings.get("frame_cache_dir")
+        if not frame_cache_dir:
+            return None
+        return os.path.abspath(frame_cache_dir), os.path.abspath(self.input_folder), self.settings.get("width")
+
+    def record(self, event):
+        """
+        Updates `progress` from a `ProgressEvent`; returns True if it changed.
+        """
+        if event.stage == "write" and event.total and event.index == event.total:
+            self._decoded = self._encoded = 1.0
+        elif event.stage in ("decode", "encode") and event.total and event.message:
+            fraction = min(1.0, (event.index + 1) / event.total)
+            if event.stage == "decode":
+                self._decoded = max(self._decoded, fraction)
+            else:
+                # Frames are decoded before they are encoded, even where decode events are not reported
+                self._encoded = max(self._encoded, fraction)
+                self._decoded = max(self._decoded, self._encoded)
+        else:
+            return False
+        progress = (self._decoded + self._encoded) / 2
+        if progress == self.progress:
+            return False
+        self.progress = progress
+        return True
+
+
+class ConversionQueue:
+    """
+    Runs conversions on up to `workers` threads at once, in the order they were submitted.
+
+    Every job gets its own `Instrumentation`, so `cancel(job_id)` stops a running job's
+    decoding and encoding at the next frame and `convert_images` removes its partial
+    output; a queued job is simply never started. `on_change(job)` is called from the
+    worker threads whenever a job's state, progress or message changes; GUIs should
+    hand it over to their main loop.
+
+    Jobs that use the same decoded-frame cache entry (folder and width) run one after
+    another, so later ones read the frames the first one stored instead of decoding
+    them again; other queued jobs may start ahead of them meanwhile.
+    """
+
+    def __init__(self, workers=DEFAULT_CONCURRENT_JOBS, on_change=None):
+        self.workers = max(1, workers)
+        self.on_change = on_change
+        self.jobs = {}
+        self._next_id = 1
+        self._threads = {}
+        self._lock = threading.Lock()
+
+    def submit(self, input_folder, output_file, **settings):
+        """
+        Queues a conversion; `settings` are passed on to `convert_images`.
+
+        Raises:
+            ValueError: If an unfinished job already writes to `output_file`.
+        """
+        with self._lock:
+            target = os.path.abspath(output_file)
+            if any(not job.finished and os.path.abspath(job.output_file) == target for job in self.jobs.values()):
+                raise ValueError(f"'{output_file}' is already being converted.")
+            job = ConversionJob(self._next_id, input_folder, output_file, settings)
+            self._next_id += 1
+            job.instrument.progress_callback = lambda current, total, message: self._on_message(job, message)
+            job.instrument.event_callback = lambda event: self._on_event(job, event)
+            self.jobs[job.id] = job
+        self._changed(job)
+        self._dispatch()
+        return job
+
+    def set_workers(self, workers):
+        """
+        Changes how many jobs run at once. Running jobs are never interrupted; fewer
+        workers only hold back queued jobs.
+        """
+        with self._lock:
+            self.workers = max(1, workers)
+        self._dispatch()
+
+    def cancel(self, job_id):
+        """
+        Cancels a queued or running job. Returns False if it has already finished.
+        """
+        with self._lock:
+            job = self.jobs.get(job_id)
+            if job is None or job.finished or job.status == CANCELLING:
+                return False
+            if job.status == QUEUED:
+                job.status, job.message = CANCELLED, "Cancelled"
+            else:
+                job.status, job.message = CANCELLING, "Cancelling..."
+                job.instrument.cancel()
+        self._changed(job)
+        return True
+
+    def clear_finished(self):
+        """
+        Forgets finished jobs and returns their ids.
+        """
+        with self._lock:
+            cleared = [job_id for job_id, job in self.jobs.items() if job.finished]
+            for job_id in cleared:
+                del self.jobs[job_id]
+        return cleared
+
+    def active(self):
+        with self._lock:
+            return [job for job in self.jobs.values() if not job.finished]
+
+    def shutdown(self, timeout=None):
+        """
+        Cancels every unfinished job and waits for the running ones to stop.
+        """
+        for job in self.active():
+            self.cancel(job.id)
+        with self._lock:
+            threads = list(self._threads.values())
+        for thread in threads:
+            thread.join(timeout)
+
+    def _changed(self, job):
+        if self.on_change:
+            self.on_change(job)
+
+    def _on_event(self, job, event):
+        if job.record(event):
+            self._changed(job)
+
+    def _on_message(self, job, message):
+        if job.status == RUNNING:
+            job.message = message
+            self._changed(job)
+
+    def _dispatch(self):
+        with self._lock:
+            active = [job for job in self.jobs.values() if job.status in (RUNNING, CANCELLING)]
+            running = len(active)
+            busy = {job.frame_cache_key for job in active} - {None}
+            started = []
+            for job in self.jobs.values():
+                if running >= self.workers:
+                    break
+                if job.status == QUEUED and job.frame_cache_key not in busy:
+                    if job.frame_cache_key:
+                        busy.add(job.frame_cache_key)
+                    job.status, job.message = RUNNING, "Starting..."
+                    thread = threading.Thread(target=self._run, args=(job,))
+                    self._threads[job.id] = thread
+                    started.append((job, thread))
+                    running += 1
+        for job, thread in started:
+            self._changed(job)
+            thread.start()
+
+    def _run(self, job):
+        try:
+            size = convert_images(job.input_folder, job.output_file, instrument=job.instrument, **job.settings)
+        except Exception as e:
+            print(f"Error converting {job.input_folder}: {e}")
+            size, job.error = False, str(e)
+
+        with self._lock:
+            if size:
+                # Also when a cancel came too late to stop it
+                job.status, job.size, job.progress, job.message = DONE, size, 1.0, "Done"
+            elif job.instrument.cancelled:
+                job.status, job.message = CANCELLED, "Cancelled"
+            else:
+                job.status = FAILED
+                job.message = job.error = job.error or "Conversion failed. Check console for details."
+            del self._threads[job.id]
+        self._changed(job)
+        self._dispatch()
@@ -0,0 +1,577 @@
+import io
+import math
+import time
+import struct
+import zlib
+from contextlib import contextmanager
+from functools import lru_cache
+
+import numpy as np
+from PIL import Image
+
+# Above this average share of the canvas changing per frame, GIF rectangles are slower and
+# larger than Pillow's full frames (measured on 640x480 sequences: break-even near 0.5).
+GIF_MAX_RECT_COVERAGE = 0.5
+
+
+def frame_array(frame):
+    """
+    Returns a frame as an RGB or RGBA uint8 array (palette and grayscale frames are expanded).
+    """
+    if isinstance(frame, np.ndarray):
+        return frame
+    if frame.mode not in ("RGB", "RGBA"):
+        frame = frame.convert("RGBA")
+    return np.asarray(frame)
+
+
+def frame_difference(a, b):
+    """
+    Mean absolute per-channel difference between two frame arrays (0-255).
+    Frames of different shapes are treated as completely different.
+    """
+    if a.shape != b.shape:
+        return 255.0
+    return float(np.abs(a.astype(np.int16) - b).mean())
+
+
+def collapse_duplicates(frames, duration, threshold=0.0):
+    """
+    Merges runs of identical or near-identical consecutive frames into one frame
+    whose duration covers the whole run.
+
+    Each frame is compared with the last frame that was kept (not just its
+    predecessor), so slow fades cannot drift past the threshold unnoticed.
+
+    Args:
+        frames (list): Frames as PIL Images or NumPy arrays.
+        duration (int or list): Per-frame duration in milliseconds, or one per frame.
+        threshold (float): Maximum mean absolute difference (0-255) for two frames to
+            count as the same. 0 only merges exact duplicates.
+
+    Returns:
+        tuple: (kept frames, list of durations in milliseconds).
+    """
+    if isinstance(duration, (list, tuple)):
+        durations = list(duration)
+    else:
+        durations = [duration] * len(frames)
+
+    kept = []
+    kept_durations = []
+    previous = None
+    for frame, frame_duration in zip(frames, durations):
+        current = frame_array(frame)
+        if previous is not None:
+            if threshold > 0:
+                same = frame_difference(previous, current) <= threshold
+            else:
+                same = previous.shape == current.shape and np.array_equal(previous, current)
+            if same:
+                kept_durations[-1] += frame_duration
+                continue
+
+        kept.append(frame)
+        kept_durations.append(frame_duration)
+        previous = current
+
+    return kept, kept_durations
+
+
+def dirty_rect(mask):
+    """
+    Returns the bounding box (left, top, right, bottom) of the True pixels of a 2D mask,
+    or None if the mask is empty.
+    """
+    rows = np.flatnonzero(mask.any(axis=1))
+    if rows.size == 0:
+        return None
+    cols = np.flatnonzero(mask.any(axis=0))
+    return (int(cols[0]), int(rows[0]), int(cols[-1]) + 1, int(rows[-1]) + 1)
+
+
+def _union(a, b):
+    if a is None:
+        return b
+    if b is None:
+        return a
+    return (min(a[0], b[0]), min(a[1], b[1]), max(a[2], b[2]), max(a[3], b[3]))
+
+
+def _rgba_frames(frames):
+    arrays = []
+    for frame in frames:
+        arr = frame_array(frame)
+        if arr.shape[2] == 3:
+            arr = np.dstack([arr, np.full(arr.shape[:2], 255, dtype=np.uint8)])
+        arrays.append(arr)
+    return arrays
+
+
+def _pixels(arr):
+    # Views an RGBA frame as one uint32 per pixel (alpha in the high byte) so that
+    # whole-pixel comparisons need a single vectorized pass instead of four
+    return np.ascontiguousarray(arr).view("<u4")[:, :, 0]
+
+
+def _png_chunks(data):
+    # Yields (type, payload) for each chunk of an encoded PNG
+    offset = 8
+    while offset < len(data):
+        length = struct.unpack(">I", data[offset:offset + 4])[0]
+        chunk_type = data[offset + 4:offset + 8]
+        yield chunk_type, data[offset + 8:offset + 8 + length]
+        offset += length + 12
+
+
+def _png_chunk(chunk_type, payload):
+    crc = zlib.crc32(chunk_type + payload) & 0xFFFFFFFF
+    return struct.pack(">I", len(payload)) + chunk_type + payload + struct.pack(">I", crc)
+
+
+@contextmanager
+def _open_output(output):
+    # Paths are opened (and closed) here; file-like objects are written to as they are
+    if hasattr(output, "write"):
+        yield output
+    else:
+        with open(output, "wb") as f:
+            yield f
+
+
+def _tell(f):
+    try:
+        return f.tell()
+    except (OSError, ValueError):
+        return None
+
+
+def _area(rect):
+    return (rect[2] - rect[0]) * (rect[3] - rect[1])
+
+
+def write_apng(frames, output_file, durations, loop=0, progress=None):
+    """
+    Writes an APNG where every frame after the first only stores the rectangle that
+    changed since the previous frame.
+
+    Changed regions are found with a NumPy diff and encoded at their offset with blend
+    op SOURCE, so the sub-rectangle (including its alpha) replaces exactly what was
+    there. For each frame the previous one is disposed either with NONE or, when that
+    gives a smaller rectangle (e.g. a sprite moving over transparency), BACKGROUND.
+    Frames with no change are merged into the previous frame's duration.
+
+    Args:
+        frames (list): Frames as PIL Images or NumPy arrays, all the same size.
+        output_file (str): Path to the output .png file, or a writable binary file object.
+        durations (int or list): Duration in milliseconds, or one per frame.
+        loop (int): Number of plays (0 = infinite).
+        progress (callable): Called with (frames done, frames to encode, bytes written)
+            after each encoded frame.
+    """
+    arrays = _rgba_frames(frames)
+    pixels = [_pixels(arr) for arr in arrays]
+    if not isinstance(durations, (list, tuple)):
+        durations = [durations] * len(arrays)
+
+    # Plan [frame index, rect, duration, dispose op] per encoded frame
+    encoded = [[0, (0, 0, arrays[0].shape[1], arrays[0].shape[0]), durations[0], 0]]
+    for i in range(1, len(arrays)):
+        changed = pixels[i] != pixels[i - 1]
+        rect = dirty_rect(changed)
+        if rect is None:
+            encoded[-1][2] += durations[i]
+            continue
+
+        # Alternative: clear the previous rectangle to transparent black first
+        left, top, right, bottom = encoded[-1][1]
+        changed[top:bottom, left:right] = pixels[i][top:bottom, left:right] != 0
+        cleared_rect = dirty_rect(changed) or (0, 0, 1, 1)
+        if _area(cleared_rect) < _area(rect):
+            encoded[-1][3] = 1
+            rect = cleared_rect
+
+        encoded.append([i, rect, durations[i], 0])
+
+    sequence = 0
+    with _open_output(output_file) as f:
+        f.write(b"\x89PNG\r\n\x1a\n")
+        for n, (index, rect, duration, dispose) in enumerate(encoded):
+            left, top, right, bottom = rect
+            buffer = io.BytesIO()
+            Image.fromarray(arrays[index][top:bottom, left:right]).save(buffer, format="PNG")
+            chunks = list(_png_chunks(buffer.getvalue()))
+
+            if n == 0:
+                ihdr = next(payload for chunk_type, payload in chunks if chunk_type == b"IHDR")
+                f.write(_png_chunk(b"IHDR", ihdr))
+                f.write(_png_chunk(b"acTL", struct.pack(">II", len(encoded), loop)))
+
+            # fcTL: sequence, size, offset, delay (ms / 1000), dispose op, blend op SOURCE
+            f.write(_png_chunk(b"fcTL", struct.pack(">IIIIIHHBB", sequence, right - left, bottom - top,
+                                                    left, top, int(duration), 1000, dispose, 0)))
+            sequence += 1
+
+            for chunk_type, payload in chunks:
+                if chunk_type != b"IDAT":
+                    continue
+                if n == 0:
+                    f.write(_png_chunk(b"IDAT", payload))
+                else:
+                    f.write(_png_chunk(b"fdAT", struct.pack(">I", sequence) + payload))
+                    sequence += 1
+
+            if progress:
+                progress(n + 1, len(encoded), _tell(f))
+
+        f.write(_png_chunk(b"IEND", b""))
+
+
+def plan_gif_rects(masks, changed):
+    """
+    Chooses the rectangle and disposal method of every GIF frame.
+
+    GIF transparency cannot erase pixels, so when a pixel turns transparent the
+    previous frame is given disposal 2 (restore to background) over a rectangle that
+    covers it, and the next frame redraws the opaque pixels that disposal cleared.
+
+    Args:
+        masks (list): Per-frame 2D boolean arrays, True where the pixel is opaque.
+        changed (list): Per-frame 2D boolean arrays, True where the pixel differs from the
+            previous frame (the first entry is ignored).
+
+    Returns:
+        tuple: (rects, disposals), with None rects for frames that are unchanged.
+    """
+    height, width = masks[0].shape
+    rects = [(0, 0, width, height)]
+    disposals = [1]
+    last = 0
+    for i in range(1, len(masks)):
+        if not changed[i].any():
+            rects.append(None)
+            disposals.append(1)
+            continue
+
+        cleared = dirty_rect(masks[last] & ~masks[i])
+        if cleared is not None:
+            rects[last] = _union(rects[last], cleared)
+            disposals[last] = 2
+
+        # Only opaque pixels need drawing: changed ones, plus any inside a disposed rectangle
+        draw = changed[i] & masks[i]
+        if disposals[last] == 2:
+            left, top, right, bottom = rects[last]
+            draw[top:bottom, left:right] |= masks[i][top:bottom, left:right]
+        # A frame that only clears pixels still needs a (transparent) rectangle to show
+        rects.append(dirty_rect(draw) or (0, 0, 1, 1))
+        disposals.append(1)
+        last = i
+    return rects, disposals
+
+
+def quantize_rect(rgb, origin=(0, 0)):
+    """
+    Default GIF quantizer: builds a palette of up to 255 colors for one rectangle,
+    using the same fast octree method Pillow applies to RGBA frames.
+
+    Returns:
+        tuple: (2D uint8 index array, palette as a flat RGB list of at most 255 colors).
+    """
+    quantized = Image.fromarray(rgb).quantize(colors=255, method=Image.Quantize.FASTOCTREE)
+    indices = np.asarray(quantized)
+    return indices, quantized.getpalette()[:(int(indices.max()) + 1) * 3]
+
+
+def _color_table(palette):
+    # Pads a flat RGB palette (plus the transparent slot) to a power-of-two GIF color table
+    colors = len(palette) // 3 + 1
+    size = 2
+    while size < colors:
+        size *= 2
+    return bytes(list(palette) + [0] * (size * 3 - len(palette)))
+
+
+def _table_bits(table):
+    return max(0, (len(table) // 3).bit_length() - 2)
+
+
+def _gif_blocks(data):
+    # Extracts (palette bytes, transparent index, LZW image data) from a single-frame GIF
+    flags = data[10]
+    offset = 13
+    palette = b""
+    if flags & 0x80:
+        size = 3 * (2 << (flags & 0x07))
+        palette = data[offset:offset + size]
+        offset += size
+
+    transparency = None
+    while data[offset] == 0x21:
+        label = data[offset + 1]
+        block = offset + 2
+        if label == 0xF9 and data[block + 1] & 0x01:
+            transparency = data[block + 4]
+        while data[block]:
+            block += data[block] + 1
+        offset = block + 1
+
+    # Image descriptor
+    descriptor_flags = data[offset + 9]
+    offset += 10
+    if descriptor_flags & 0x80:
+        size = 3 * (2 << (descriptor_flags & 0x07))
+        palette = data[offset:offset + size]
+        offset += size
+
+    start = offset
+    offset += 1  # LZW minimum code size
+    while data[offset]:
+        offset += data[offset] + 1
+    return palette, transparency, data[start:offset + 1]
+
+
+def write_gif(frames, output_file, durations, loop=0, quantize=quantize_rect, palette=None, progress=None,
+              max_coverage=None):
+    """
+    Writes a GIF where every frame after the first only stores the rectangle that
+    changed since the previous frame.
+
+    Changed regions come from a NumPy diff of the frames (alpha is thresholded at 128,
+    as GIF only has on/off transparency). Inside a rectangle, pixels that did not
+    change are written as transparent so they compress well; pixels that turn
+    transparent are handled by `plan_gif_rects`. Each rectangle is quantized by
+    `quantize` and stored with its own local color table.
+
+    Args:
+        frames (list): Frames as PIL Images or NumPy arrays, all the same size.
+        output_file (str): Path to the output .gif file, or a writable binary file object.
+        durations (int or list): Duration in milliseconds, or one per frame.
+        loop (int): Number of loops (0 = infinite).
+        quantize (callable): Maps an (h, w, 3) RGB array and its (left, top) origin to
+            (indices, flat RGB palette) with at most 255 colors; the index after the last
+            color is used for transparency.
+        palette (list): Flat RGB palette shared by every frame (see `GlobalPalette`). It is
+            written once as the global color table instead of one table per frame.
+        progress (callable): Called with (frames done, frames to encode, bytes written)
+            after each encoded frame.
+        max_coverage (float): If the rectangles of the frames after the first cover more than
+            this share of the canvas on average, nothing is written (see `GIF_MAX_RECT_COVERAGE`).
+
+    Returns:
+        bool: True if the GIF was written, False if the rectangles covered too much.
+    """
+    arrays = _rgba_frames(frames)
+    if not isinstance(durations, (list, tuple)):
+        durations = [durations] * len(arrays)
+
+    height, width = arrays[0].shape[:2]
+    # The changed pixels' bounding boxes are at most as large as the planned rectangles,
+    # so once they exceed the limit the GIF is known to cover too much
+    area_limit = max_coverage * (len(arrays) - 1) * width * height if max_coverage is not None else None
+    changed_area = 0
+
+    masks = []
+    changed = [None]
+    previous = None
+    for arr in arrays:
+        mask = arr[:, :, 3] >= 128
+        # Opaque pixels compare by color only; transparent pixels all compare equal
+        pixels = np.where(mask, _pixels(arr) | np.uint32(0xFF000000), 0)
+        if previous is not None:
+            changed.append(pixels != previous)
+            if area_limit is not None:
+                changed_area += _area(dirty_rect(changed[-1]) or (0, 0, 0, 0))
+                if changed_area > area_limit:
+                    return False
+        masks.append(mask)
+        previous = pixels
+    rects, disposals = plan_gif_rects(masks, changed)
+
+    if area_limit is not None and len(rects) > 1:
+        if sum(_area(rect) for rect in rects[1:] if rect) > area_limit:
+            return False
+
+    # Merge unchanged frames into the previous frame's duration
+    encoded = []
+    for i, rect in enumerate(rects):
+        if rect is None:
+            encoded[-1][1] += durations[i]
+        else:
+            encoded.append([i, durations[i]])
+
+    global_table = b""
+    if palette is not None:
+        global_table = _color_table(palette)
+
+    with _open_output(output_file) as f:
+        # Header and logical screen descriptor, with the shared palette if there is one
+        flags = 0x80 | _table_bits(global_table) if global_table else 0
+        f.write(b"GIF89a" + struct.pack("<HHBBB", width, height, flags, 0, 0) + global_table)
+        # NETSCAPE2.0 looping extension
+        f.write(b"\x21\xff\x0bNETSCAPE2.0\x03\x01" + struct.pack("<H", loop) + b"\x00")
+
+        disposed = None
+        for n, (index, duration) in enumerate(encoded):
+            left, top, right, bottom = rects[index]
+            draw = masks[index][top:bottom, left:right].copy()
+            if index > 0:
+                # Unchanged pixels can stay transparent unless the previous disposal cleared them
+                keep = ~changed[index][top:bottom, left:right]
+                if disposed is not None:
+                    d_left, d_top, d_right, d_bottom = disposed
+                    keep[max(d_top - top, 0):max(d_bottom - top, 0), max(d_left - left, 0):max(d_right - left, 0)] = False
+                draw &= ~keep
+
+            opaque = masks[index][top:bottom, left:right, None]
+            rgb = np.where(opaque, arrays[index][top:bottom, left:right, :3], 0).astype(np.uint8)
+            indices, frame_palette = quantize(rgb, origin=(left, top))
+            transparent_index = len(frame_palette) // 3
+            indices = np.where(draw, indices, transparent_index).astype(np.uint8)
+
+            sub = Image.frombytes("P", (right - left, bottom - top), indices.tobytes())
+            sub.putpalette(list(frame_palette) + [0, 0, 0])
+            buffer = io.BytesIO()
+            sub.save(buffer, format="GIF", transparency=transparent_index, optimize=False, interlace=False)
+            palette_bytes, transparency, image_data = _gif_blocks(buffer.getvalue())
+
+            # Graphic control extension: disposal, transparency flag, delay in 1/100 s
+            packed = (disposals[index] << 2) | (1 if transparency is not None else 0)
+            f.write(b"\x21\xf9\x04" + struct.pack("<BHB", packed, int(round(duration / 10)), transparency or 0) + b"\x00")
+
+            # Image descriptor, with a local color table unless the frame uses the global one
+            if global_table and palette_bytes == global_table:
+                f.write(b"\x2c" + struct.pack("<HHHHB", left, top, right - left, bottom - top, 0))
+            else:
+                f.write(b"\x2c" + struct.pack("<HHHHB", left, top, right - left, bottom - top,
+                                               0x80 | _table_bits(palette_bytes)))
+                f.write(palette_bytes)
+            f.write(image_data)
+
+            disposed = rects[index] if disposals[index] == 2 else None
+            if progress:
+                progress(n + 1, len(encoded), _tell(f))
+
+        f.write(b"\x3b")
+    return True
+
+
+# 4x4 Bayer matrix, normalized to offsets in [-0.5, 0.5)
+BAYER_4X4 = (np.array([[0, 8, 2, 10],
+                       [12, 4, 14, 6],
+                       [3, 11, 1, 9],
+                       [15, 7, 13, 5]], dtype=np.float32) + 0.5) / 16 - 0.5
+
+
+def build_palette(frames, colors=255, subsample=4, max_samples=1 << 16):
+    """
+    Builds one palette for a whole sequence from a sample of its opaque pixels.
+
+    The sample is quantized with Pillow's fast octree; on 640x480 frames it matches
+    median cut's color error at a fraction of the time.
+
+    Args:
+        frames (list): Frames as PIL Images or NumPy arrays.
+        colors (int): Number of palette colors (at most 255; one index is kept for transparency).
+        subsample (int): Take every n-th pixel along both axes of every frame.
+        max_samples (int): Upper bound on sampled pixels. Beyond it, every frame is sampled
+            more sparsely (on a grid shifted from frame to frame) rather than frames skipped.
+
+    Returns:
+        np.ndarray: (colors, 3) uint8 palette.
+    """
+    first = frame_array(frames[0])
+    height, width = first.shape[:2]
+    per_frame = max(1, max_samples // len(frames))
+    step = max(1, subsample, math.ceil(math.sqrt(height * width / per_frame)))
+
+    samples = []
+    for i, frame in enumerate(frames):
+        arr = frame_array(frame)[i % step::step, (i // step) % step::step]
+        if arr.shape[2] == 4:
+            arr = arr[arr[:, :, 3] >= 128][:, :3]
+        samples.append(arr.reshape(-1, 3))
+    pixels = np.concatenate(samples) if samples else np.zeros((0, 3), dtype=np.uint8)
+    if len(pixels) == 0:
+        pixels = np.zeros((1, 3), dtype=np.uint8)
+
+    sample_image = Image.fromarray(np.ascontiguousarray(pixels[None, :, :]))
+    quantized = sample_image.quantize(colors=min(255, colors), method=Image.Quantize.FASTOCTREE)
+    used = int(np.asarray(quantized).max()) + 1
+    return np.array(quantized.getpalette()[:used * 3], dtype=np.uint8).reshape(-1, 3)
+
+
+@lru_cache(maxsize=8)
+def _palette_lut(palette_bytes):
+    # Nearest palette index for every color at 5 bits per channel (32768 entries)
+    palette = np.frombuffer(palette_bytes, dtype=np.uint8).reshape(-1, 3).astype(np.float32)
+    levels = np.arange(32, dtype=np.float32) * 8 + 4
+    r, g, b = np.meshgrid(levels, levels, levels, indexing="ij")
+    grid = np.stack([r.ravel(), g.ravel(), b.ravel()], axis=1)
+
+    # |c - p|^2 = |c|^2 - 2 c.p + |p|^2; |c|^2 is constant per row, so it can be dropped
+    distances = (palette ** 2).sum(axis=1)[None, :] - 2 * grid @ palette.T
+    return distances.argmin(axis=1).astype(np.uint8)
+
+
+class GlobalPalette:
+    """
+    One palette shared by every GIF frame, applied through a cached lookup table.
+
+    Building samples pixels from the whole sequence (`build_palette`); mapping
+    looks every pixel up in a 32768-entry table of nearest palette colors, with
+    optional ordered (Bayer) dithering anchored to absolute canvas positions so the
+    pattern does not crawl between frames. Instances are callable as a `write_gif`
+    quantizer, and `timings` reports the time spent in each stage.
+    """
+
+    def __init__(self, frames, colors=255, subsample=4, dither=False, dither_strength=16):
+        start = time.perf_counter()
+        self.colors = build_palette(frames, colors, subsample)
+        self.palette = self.colors.ravel().tolist()
+        built = time.perf_counter()
+        self.lut = _palette_lut(self.colors.tobytes())
+        self.timings = {
+            "palette_seconds": built - start,
+            "lut_seconds": time.perf_counter() - built,
+            "mapping_seconds": 0.0,
+        }
+        self.dither = dither
+        self.dither_strength = dither_strength
+
+    def map(self, rgb, origin=(0, 0)):
+        """
+        Maps an (h, w, 3) RGB array to palette indices.
+        """
+        start = time.perf_counter()
+        if self.dither:
+            height, width = rgb.shape[:2]
+            left, top = origin
+            rows = (np.arange(top, top + height) % 4)[:, None]
+            cols = (np.arange(left, left + width) % 4)[None, :]
+            offset = BAYER_4X4[rows, cols][:, :, None] * self.dither_strength
+            rgb = np.clip(rgb + offset, 0, 255).astype(np.uint8)
+
+        q = (rgb >> 3).astype(np.int32)
+        indices = self.lut[(q[:, :, 0] << 10) | (q[:, :, 1] << 5) | q[:, :, 2]]
+        self.timings["mapping_seconds"] += time.perf_counter() - start
+        return indices
+
+    def __call__(self, rgb, origin=(0, 0)):
+        return self.map(rgb, origin), self.palette
+
+    def to_image(self, frame):
+        """
+        Maps a whole frame to a "P" image on this palette; pixels with alpha below 128
+        use the transparent index, len(palette) // 3.
+        """
+        arr = frame_array(frame)
+        indices = self.map(np.ascontiguousarray(arr[:, :, :3]))
+        transparent_index = len(self.palette) // 3
+        if arr.shape[2] == 4:
+            indices = np.where(arr[:, :, 3] >= 128, indices, transparent_index).astype(np.uint8)
+
+        image = Image.frombytes("P", (arr.shape[1], arr.shape[0]), indices.tobytes())
+        image.putpalette(self.palette + [0, 0, 0])
+        image.info["transparency"] = transparent_index
+        return image
@@ -0,0 +1,262 @@
+import os
+import re
+import json
+import time
+import zlib
+import struct
+import hashlib
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+
+# Where scan indexes are kept between runs.
+DEFAULT_INDEX_DIR = os.path.join(tempfile.gettempdir(), "sequence2motion-index")
+
+# Header reads are I/O-bound, so more threads than cores help on network and spinning disks.
+DEFAULT_SCAN_WORKERS = min(16, 4 * (os.cpu_count() or 1))
+
+PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+
+# Every PNG ends with an empty IEND chunk: its type and CRC.
+PNG_END = b"IEND\xaeB`\x82"
+
+# PNG color types, as the PIL modes they decode to.
+COLOR_MODES = {0: "L", 2: "RGB", 3: "P", 4: "LA", 6: "RGBA"}
+
+# Names shown per problem before the rest are summarized.
+MAX_LISTED = 5
+
+_DIGITS = re.compile(r"(\d+)")
+_NUMBERED = re.compile(r"^(.*?)(\d+)(\D*)$")
+
+
+def natural_key(name):
+    """
+    Sort key that orders embedded numbers by value, so "frame2.png" sorts before "frame10.png".
+    """
+    parts = _DIGITS.split(name)
+    return [int(part) if i % 2 else part.casefold() for i, part in enumerate(parts)], name
+
+
+def list_frames(input_folder):
+    """
+    Returns the PNG file names in a folder in natural order ("frame2" before "frame10").
+    """
+    files = [f for f in os.listdir(input_folder) if f.lower().endswith('.png')]
+    files.sort(key=natural_key)
+    return files
+
+
+def is_complete_png(file_path):
+    """
+    Returns True once a PNG has been written up to its IEND chunk.
+    """
+    try:
+        with open(file_path, "rb") as f:
+            f.seek(0, os.SEEK_END)
+            if f.tell() < len(PNG_END):
+                return False
+            f.seek(-len(PNG_END), os.SEEK_END)
+            return f.read() == PNG_END
+    except OSError:
+        return False
+
+
+def read_png_header(file_path):
+    """
+    Reads a PNG's size, bit depth and color type from its IHDR chunk, without decoding.
+
+    Also checks that the file ends with IEND, which catches truncated files.
+
+    Returns:
+        dict: {"width", "height", "bit_depth", "mode"}, or {"error"} for an unusable file.
+    """
+    try:
+        with open(file_path, "rb") as f:
+            head = f.read(33)
+            f.seek(0, os.SEEK_END)
+            complete = f.tell() >= 33 + len(PNG_END)
+            if complete:
+                f.seek(-len(PNG_END), os.SEEK_END)
+                complete = f.read() == PNG_END
+    except OSError as e:
+        return {"error": e.strerror or str(e)}
+
+    if len(head) < 33 or head[:8] != PNG_SIGNATURE or head[12:16] != b"IHDR":
+        return {"error": "not a PNG file"}
+    if zlib.crc32(head[12:29]) != struct.unpack(">I", head[29:33])[0]:
+        return {"error": "corrupt header"}
+    if not complete:
+        return {"error": "truncated"}
+    width, height, bit_depth, color_type = struct.unpack(">IIBB", head[16:26])
+    return {"width": width, "height": height, "bit_depth": bit_depth, "mode": COLOR_MODES.get(color_type, "?")}
+
+
+def find_gaps(files):
+    """
+    Finds missing numbers in numbered frame names (e.g. frame_0007.png between 0006 and 0008).
+
+    Names are grouped by the text around their last number, so several sequences in one
+    folder are checked separately.
+
+    Returns:
+        list: (first missing name, last missing name, count) per gap.
+    """
+    groups = {}
+    for name in files:
+        match = _NUMBERED.match(name)
+        if match:
+            prefix, digits, suffix = match.groups()
+            groups.setdefault((prefix, suffix), {})[int(digits)] = len(digits)
+
+    gaps = []
+    for (prefix, suffix), numbers in groups.items():
+        ordered = sorted(numbers)
+        for a, b in zip(ordered, ordered[1:]):
+            if b - a > 1:
+                pad = numbers[a]
+                gaps.append((f"{prefix}{a + 1:0{pad}d}{suffix}", f"{prefix}{b - 1:0{pad}d}{suffix}", b - a - 1))
+    return gaps
+
+
+class ScanIndex:
+    """
+    Remembers PNG headers per folder, keyed by file name, size and mtime.
+
+    A rescan only reads the headers of files that are new or have changed since.
+    """
+
+    def __init__(self, index_dir=DEFAULT_INDEX_DIR):
+        self.index_dir = index_dir
+
+    def _path(self, input_folder):
+        name = os.path.abspath(input_folder)
+        return os.path.join(self.index_dir, hashlib.sha256(name.encode("utf-8")).hexdigest()[:32] + ".json")
+
+    def load(self, input_folder):
+        try:
+            with open(self._path(input_folder)) as f:
+                return json.load(f)["frames"]
+        except (OSError, ValueError, KeyError):
+            return {}
+
+    def save(self, input_folder, frames):
+        # The index only saves work, so failing to write it is not an error
+        path = self._path(input_folder)
+        tmp = f"{path}.{os.getpid()}.tmp"
+        try:
+            os.makedirs(self.index_dir, exist_ok=True)
+            with open(tmp, "w") as f:
+                json.dump({"folder": os.path.abspath(input_folder), "frames": frames}, f)
+            os.replace(tmp, path)
+        except OSError:
+            pass
+
+
+def scan_frames(input_folder, files=None, workers=DEFAULT_SCAN_WORKERS, index_dir=DEFAULT_INDEX_DIR):
+    """
+    Lists a folder's PNG frames in natural order and checks every frame's header in parallel.
+
+    Only the first bytes and the end of each file are read. Frames whose size or color mode
+    differ from the first frame, and unreadable or truncated files, are reported, as are gaps
+    in numbered names. With `index_dir`, headers are cached (see `ScanIndex`).
+
+    Args:
+        input_folder (str): Folder containing PNG images.
+        files (list): Frame names to check (default: every PNG in the folder).
+        workers (int): Threads reading headers.
+        index_dir (str): Scan index directory, or None to always read every header.
+
+    Returns:
+        dict: {"files", "width", "height", "mode", "bit_depth", "size_mismatches",
+        "mode_mismatches", "corrupt", "gaps", "cached", "stats", "seconds"}. The mismatch
+        and corrupt lists hold (name, detail) pairs; "stats" maps each file that could be
+        stat'ed to its (size, mtime_ns).
+    """
+    start = time.perf_counter()
+    files = list_frames(input_folder) if files is None else sorted(files, key=natural_key)
+
+    index = ScanIndex(index_dir) if index_dir else None
+    known = index.load(input_folder) if index else {}
+
+    # Stat every file (cheap), then read headers of new or changed files only
+    headers = {}
+    stats = {}
+    changed = []
+    cached = 0
+    for name in files:
+        try:
+            st = os.stat(os.path.join(input_folder, name))
+        except OSError as e:
+            headers[name] = {"error": e.strerror or str(e)}
+            continue
+        stats[name] = (st.st_size, st.st_mtime_ns)
+        entry = known.get(name)
+        if entry and entry["size"] == st.st_size and entry["mtime_ns"] == st.st_mtime_ns:
+            headers[name] = entry
+            cached += 1
+        else:
+            changed.append((name, st.st_size, st.st_mtime_ns))
+
+    def probe(item):
+        name, size, mtime_ns = item
+        return dict(read_png_header(os.path.join(input_folder, name)), size=size, mtime_ns=mtime_ns)
+
+    if changed:
+        with ThreadPoolExecutor(max_workers=max(1, min(workers, len(changed)))) as pool:
+            headers.update(zip((name for name, _, _ in changed), pool.map(probe, changed)))
+
+    report = {"files": files, "width": None, "height": None, "mode": None, "bit_depth": None,
+              "size_mismatches": [], "mode_mismatches": [], "corrupt": [], "gaps": find_gaps(files),
+              "cached": cached, "stats": stats, "seconds": 0.0}
+    for name in files:
+        header = headers[name]
+        if "error" in header:
+            report["corrupt"].append((name, header["error"]))
+        elif report["width"] is None:
+            report.update(width=header["width"], height=header["height"], mode=header["mode"],
+                          bit_depth=header["bit_depth"])
+        else:
+            if (header["width"], header["height"]) != (report["width"], report["height"]):
+                report["size_mismatches"].append((name, f"{header['width']}x{header['height']}"))
+            if (header["mode"], header["bit_depth"]) != (report["mode"], report["bit_depth"]):
+                report["mode_mismatches"].append((name, f"{header['mode']} {header['bit_depth']}-bit"))
+
+    valid = {name: header for name, header in headers.items() if "error" not in header}
+    if index and (changed or valid.keys() != known.keys()):
+        # Unreadable files are probed again next time, in case they were still being written
+        index.save(input_folder, valid)
+    report["seconds"] = time.perf_counter() - start
+    return report
+
+
+def _listing(items):
+    shown = ", ".join(f"{name} ({detail})" for name, detail in items[:MAX_LISTED])
+    if len(items) > MAX_LISTED:
+        shown += f" and {len(items) - MAX_LISTED} more"
+    return shown
+
+
+def scan_problems(report):
+    """
+    Describes a scan report's problems.
+
+    Returns:
+        tuple: (errors, warnings) as lists of messages. Errors (unreadable frames, frames
+        of another size) would fail or break the encode; warnings (gaps, mixed color modes)
+        are worth a look but convert fine.
+    """
+    errors, warnings = [], []
+    if report["corrupt"]:
+        errors.append(f"{len(report['corrupt'])} unreadable PNG files: {_listing(report['corrupt'])}")
+    if report["size_mismatches"]:
+        errors.append(f"{len(report['size_mismatches'])} frames differ in size from "
+                      f"{report['width']}x{report['height']}: {_listing(report['size_mismatches'])}")
+    if report["gaps"]:
+        missing = sum(count for _, _, count in report["gaps"])
+        listed = [(first if count == 1 else f"{first}..{last}", f"{count} missing")
+                  for first, last, count in report["gaps"]]
+        warnings.append(f"{missing} frames missing from the numbered sequence: {_listing(listed)}")
+    if report["mode_mismatches"]:
+        warnings.append(f"{len(report['mode_mismatches'])} frames differ in color mode from "
+                        f"{report['mode']} {report['bit_depth']}-bit: {_listing(report['mode_mismatches'])}")
+    return errors, warnings
@@ -0,0 +1,165 @@
+import os
+import threading
+from collections import OrderedDict
+
+from PIL import Image
+
+# Largest thumbnail size; frames are scaled down to fit, keeping their aspect ratio.
+DEFAULT_THUMBNAIL_SIZE = (320, 180)
+
+# Memory bound of the thumbnail cache (64 MB, ~280 thumbnails at the default size).
+DEFAULT_PREVIEW_CACHE_BYTES = 64 * 1024 * 1024
+
+# Frames decoded ahead of the playhead.
+DEFAULT_PREFETCH = 24
+
+
+def _image_bytes(img):
+    return img.width * img.height * len(img.getbands())
+
+
+class ThumbnailCache:
+    """
+    Thread-safe LRU cache of thumbnails, bounded by the bytes of their pixel data.
+    """
+
+    def __init__(self, max_bytes=DEFAULT_PREVIEW_CACHE_BYTES):
+        self.max_bytes = max_bytes
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __contains__(self, key):
+        with self._lock:
+            return key in self._entries
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
+
+    def get(self, key):
+        with self._lock:
+            img = self._entries.get(key)
+            if img is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return img
+
+    def put(self, key, img):
+        with self._lock:
+            if key in self._entries:
+                self.bytes -= _image_bytes(self._entries.pop(key))
+            self._entries[key] = img
+            self.bytes += _image_bytes(img)
+            # Evict least recently used, but always keep the newest thumbnail
+            while self.bytes > self.max_bytes and len(self._entries) > 1:
+                _, evicted = self._entries.popitem(last=False)
+                self.bytes -= _image_bytes(evicted)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.bytes = 0
+
+
+def load_thumbnail(file_path, size=DEFAULT_THUMBNAIL_SIZE):
+    """
+    Decodes a frame and scales it down to fit `size`.
+    """
+    with Image.open(file_path) as img:
+        img = img.convert("RGBA") if img.mode not in ("RGB", "RGBA") else img.copy()
+    img.thumbnail(size, Image.Resampling.BILINEAR)
+    return img
+
+
+class PreviewLoader:
+    """
+    Decodes thumbnails of a frame sequence on one background thread.
+
+    `request(index)` moves the playhead and returns immediately. The thread decodes the
+    requested frame first, then up to `prefetch` frames after it (wrapping around, as
+    playback loops), skipping any already in `cache`. A new request interrupts the
+    prefetch. `on_ready(index)` is called from the thread when the requested frame is
+    in the cache; GUIs should hand it over to their main loop.
+
+    `stats` maps file names to their (size, mtime_ns), as in the `scan_frames` report.
+    They are part of the cache keys, so a frame that was rendered again since its
+    thumbnail was cached is decoded again.
+    """
+
+    def __init__(self, input_folder, files, cache=None, size=DEFAULT_THUMBNAIL_SIZE, prefetch=DEFAULT_PREFETCH,
+                 on_ready=None, stats=None):
+        self.input_folder = input_folder
+        self.files = list(files)
+        self.stats = stats or {}
+        self.cache = cache if cache is not None else ThumbnailCache()
+        self.size = size
+        self.prefetch = prefetch
+        self.on_ready = on_ready
+        self.errors = {}
+        self._target = None
+        self._requests = 0
+        self._closed = False
+        self._wake = threading.Condition()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def key(self, index):
+        name = self.files[index]
+        return (self.input_folder, name, self.stats.get(name), self.size)
+
+    def get(self, index):
+        """
+        Returns the cached thumbnail of a frame, or None if it is not decoded yet.
+        """
+        return self.cache.get(self.key(index))
+
+    def request(self, index):
+        with self._wake:
+            self._target = index
+            self._requests += 1
+            self._wake.notify()
+
+    def close(self):
+        with self._wake:
+            self._closed = True
+            self._wake.notify()
+
+    def _next_request(self, handled):
+        # Waits for a request newer than `handled`; returns (request number, index), or None once closed
+        with self._wake:
+            while not self._closed and self._requests == handled:
+                self._wake.wait()
+            return None if self._closed else (self._requests, self._target)
+
+    def _interrupted(self, request):
+        with self._wake:
+            return self._closed or self._requests != request
+
+    def _load(self, index):
+        key = self.key(index)
+        if key in self.cache or index in self.errors:
+            return
+        try:
+            self.cache.put(key, load_thumbnail(os.path.join(self.input_folder, self.files[index]), self.size))
+        except Exception as e:
+            self.errors[index] = str(e)
+
+    def _run(self):
+        handled = 0
+        while True:
+            pending = self._next_request(handled)
+            if pending is None:
+                return
+            handled, target = pending
+            self._load(target)
+            if self.on_ready and not self._interrupted(handled):
+                self.on_ready(target)
+            for step in range(1, min(self.prefetch, len(self.files) - 1) + 1):
+                if self._interrupted(handled):
+                    break
+                self._load((target + step) % len(self.files))
@@ -0,0 +1,413 @@
+import os
+import sys
+import json
+import time
+import uuid
+import shutil
+import signal
+import argparse
+import tempfile
+import ipaddress
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse
+
+from batch import JOB_SETTINGS, run_job
+from formats import extension_map, format_for_path
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8765
+
+# Jobs converted at once; each runs in its own warm worker process.
+DEFAULT_SERVER_WORKERS = max(1, (os.cpu_count() or 1) // 2)
+
+# Jobs accepted but not yet finished (queued or running) before new ones are refused.
+DEFAULT_MAX_PENDING = 16
+
+STREAM_CHUNK = 1 << 16
+
+# Progress queue of the current worker process, set by `_init_worker`.
+_events = None
+
+
+def _init_worker(events):
+    # Runs once per worker process: pay the import cost before the first job arrives
+    global _events
+    _events = events
+    import convert  # noqa: F401
+    import imageio_ffmpeg
+    imageio_ffmpeg.get_ffmpeg_exe()
+
+
+def _warm():
+    return os.getpid()
+
+
+def _run_job(job_id, job):
+    def progress(current, total, message):
+        _events.put((job_id, current, total, message))
+
+    return run_job(job, progress_callback=progress)
+
+
+def is_loopback(host):
+    if host == "localhost":
+        return True
+    try:
+        return ipaddress.ip_address(host).is_loopback
+    except ValueError:
+        return False
+
+
+def is_loopback_host_header(value):
+    # "localhost:8765", "127.0.0.1", "[::1]:8765", ...
+    try:
+        host = urlparse(f"//{value}").hostname
+    except ValueError:
+        return False
+    return bool(host) and is_loopback(host)
+
+
+class JobQueue:
+    """
+    Runs conversion jobs on a pool of warm worker processes.
+
+    Worker processes are started (and have imported the encoders) before the first job,
+    and are reused for every job. At most `workers` jobs convert at once; further jobs
+    wait in the pool's queue, and `submit` refuses jobs once `max_pending` are unfinished.
+    Progress from each job's `progress_callback` is relayed through a queue and kept
+    with the job.
+    """
+
+    def __init__(self, workers=DEFAULT_SERVER_WORKERS, max_pending=DEFAULT_MAX_PENDING, output_dir=None):
+        self.workers = max(1, workers)
+        self.max_pending = max_pending
+        self.output_dir = output_dir or tempfile.mkdtemp(prefix="sequence2motion-")
+        self._owns_output_dir = output_dir is None
+        os.makedirs(self.output_dir, exist_ok=True)
+        self.jobs = {}
+        self._futures = {}
+        self._lock = threading.Lock()
+
+        self._context = multiprocessing.get_context("spawn")
+        self._events = self._context.Queue()
+        self._pool = self._new_pool()
+        self._relay = threading.Thread(target=self._relay_progress, daemon=True)
+        self._relay.start()
+
+    def _new_pool(self):
+        return ProcessPoolExecutor(max_workers=self.workers, mp_context=self._context,
+                                   initializer=_init_worker, initargs=(self._events,))
+
+    def warm_up(self):
+        """
+        Starts every worker process and waits until they are ready. Returns the seconds taken.
+        """
+        start = time.perf_counter()
+        # Submitting before any task finishes makes the pool start one process per task
+        futures = [self._pool.submit(_warm) for _ in range(self.workers)]
+        for future in futures:
+            future.result()
+        return time.perf_counter() - start
+
+    def _relay_progress(self):
+        while True:
+            event = self._events.get()
+            if event is None:
+                return
+            job_id, current, total, message = event
+            with self._lock:
+                job = self.jobs.get(job_id)
+                if job is None:
+                    continue
+                if job["status"] == "queued":
+                    job["status"] = "running"
+                    job["started"] = time.time()
+                job["progress"] = {"current": current, "total": total, "message": message}
+
+    def submit(self, request):
+        """
+        Queues a job from a request {"input", "format" or "output", settings...}.
+
+        Without "output", the result is written to the server's output folder (and removed
+        with the job). Settings are the same as for batch manifests (`batch.JOB_SETTINGS`).
+
+        Raises:
+            ValueError: For an invalid request.
+            OverflowError: When `max_pending` jobs are already unfinished.
+        """
+        if not isinstance(request, dict) or not request.get("input"):
+            raise ValueError("a job needs an 'input' folder")
+        unknown = set(request) - set(JOB_SETTINGS) - {"input", "output", "format"}
+        if unknown:
+            raise ValueError(f"Unknown job settings {sorted(unknown)}. Choose from: {', '.join(JOB_SETTINGS)}.")
+        input_folder = os.path.abspath(request["input"])
+        if not os.path.isdir(input_folder):
+            raise ValueError(f"Folder '{request['input']}' not found.")
+
+        job_id = uuid.uuid4().hex[:12]
+        output_format = request.get("format")
+        if request.get("output"):
+            output = os.path.abspath(request["output"])
+            owned = False
+        elif output_format in extension_map():
+            output = os.path.join(self.output_dir, job_id + extension_map()[output_format])
+            owned = True
+        else:
+            raise ValueError(f"a job needs an 'output' path or a 'format' ({', '.join(extension_map())})")
+
+        settings = {name: request[name] for name in JOB_SETTINGS if request.get(name) is not None}
+        job = {"input": input_folder, "output": output, "settings": settings}
+        with self._lock:
+            pending = sum(j["status"] in ("queued", "running") for j in self.jobs.values())
+            if pending >= self.max_pending:
+                raise OverflowError(f"{pending} jobs are already pending")
+            self.jobs[job_id] = {"id": job_id, "status": "queued", "input": input_folder, "output": output,
+                                 "owned": owned, "submitted": time.time(), "started": None, "progress": None,
+                                 "size": None, "seconds": None, "stages": None, "error": None}
+            try:
+                future = self._pool.submit(_run_job, job_id, job)
+            except BrokenProcessPool:
+                # A crashed worker takes the whole pool down; start a fresh one
+                self._pool.shutdown(wait=False, cancel_futures=True)
+                self._pool = self._new_pool()
+                future = self._pool.submit(_run_job, job_id, job)
+            self._futures[job_id] = future
+        future.add_done_callback(lambda f: self._finish(job_id, f))
+        return job_id
+
+    def _finish(self, job_id, future):
+        if future.cancelled():
+            return
+        try:
+            record = future.result()
+        except Exception as e:
+            record = {"size": None, "seconds": None, "stages": None, "error": f"worker failed: {e}"}
+        with self._lock:
+            job = self.jobs.get(job_id)
+            if job is None:
+                return
+            job.update(size=record["size"], seconds=record["seconds"], stages=record["stages"],
+                       error=record["error"], status="failed" if record["error"] else "done")
+            self._futures.pop(job_id, None)
+
+    def status(self, job_id):
+        with self._lock:
+            job = self.jobs.get(job_id)
+            if job is None:
+                return None
+            status = {k: v for k, v in job.items() if k != "owned"}
+            if job["owned"]:
+                # Server-side paths of generated outputs are an implementation detail
+                status["output"] = f"/jobs/{job_id}/output"
+            return status
+
+    def list(self):
+        with self._lock:
+            job_ids = list(self.jobs)
+        return [self.status(job_id) for job_id in job_ids]
+
+    def output(self, job_id):
+        """
+        Returns the output path of a job, or None for an unknown one.
+        """
+        with self._lock:
+            job = self.jobs.get(job_id)
+            return None if job is None else job["output"]
+
+    def remove(self, job_id):
+        """
+        Cancels a queued job or forgets a finished one (deleting the output it owns).
+        Returns False for a running job, which cannot be stopped, and None for an unknown one.
+        """
+        with self._lock:
+            job = self.jobs.get(job_id)
+            if job is None:
+                return None
+            if job["status"] == "running":
+                return False
+            future = self._futures.pop(job_id, None)
+            if future is not None and not future.cancel():
+                # Started after all; progress has not been relayed yet
+                self._futures[job_id] = future
+                return False
+            del self.jobs[job_id]
+        if job["owned"] and os.path.exists(job["output"]):
+            os.remove(job["output"])
+        return True
+
+    def shutdown(self):
+        self._pool.shutdown(wait=True, cancel_futures=True)
+        self._events.put(None)
+        self._relay.join()
+        if self._owns_output_dir:
+            shutil.rmtree(self.output_dir, ignore_errors=True)
+
+
+class RequestHandler(BaseHTTPRequestHandler):
+    """
+    JSON API over a `JobQueue`:
+
+        POST   /jobs              queue a job (a JSON body), returns {"id"} (503 when the queue is full)
+        GET    /jobs              every job's status
+        GET    /jobs/<id>         status, progress, size, stage timings and error
+        GET    /jobs/<id>/output  the finished output, streamed
+        DELETE /jobs/<id>         cancel a queued job or forget a finished one
+    """
+
+    server_version = "sequence2motion"
+    jobs = None
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+    def _send_json(self, code, payload, headers=None):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(code)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _route(self):
+        parts = [part for part in urlparse(self.path).path.split("/") if part]
+        if not parts or parts[0] != "jobs" or len(parts) > 3 or (len(parts) == 3 and parts[2] != "output"):
+            return None
+        return parts[1:]
+
+    def _allowed(self):
+        # The server binds to loopback; refuse anything else should it ever be reachable
+        if not is_loopback(self.client_address[0]):
+            self._send_json(403, {"error": "only local clients are served"})
+            return False
+        # Browsers on the same machine are local clients too: a page served under a rebound
+        # DNS name carries its own Host, and a cross-site request an Origin
+        if not is_loopback_host_header(self.headers.get("Host", "")):
+            self._send_json(403, {"error": "Host must be a loopback name or address"})
+            return False
+        if "Origin" in self.headers:
+            self._send_json(403, {"error": "requests from web pages are not served"})
+            return False
+        return True
+
+    def do_POST(self):
+        if not self._allowed():
+            return
+        if self._route() != []:
+            return self._send_json(404, {"error": "not found"})
+        # Browsers send other content types cross-site without asking first
+        if self.headers.get_content_type() != "application/json":
+            return self._send_json(415, {"error": "Content-Type must be application/json"})
+        try:
+            length = int(self.headers.get("Content-Length", 0))
+            request = json.loads(self.rfile.read(length) or b"{}")
+            job_id = self.jobs.submit(request)
+        except OverflowError as e:
+            return self._send_json(503, {"error": str(e)}, {"Retry-After": "5"})
+        except ValueError as e:
+            return self._send_json(400, {"error": str(e)})
+        self._send_json(202, {"id": job_id, "status": f"/jobs/{job_id}"}, {"Location": f"/jobs/{job_id}"})
+
+    def do_GET(self):
+        if not self._allowed():
+            return
+        route = self._route()
+        if route is None:
+            return self._send_json(404, {"error": "not found"})
+        if not route:
+            return self._send_json(200, self.jobs.list())
+
+        status = self.jobs.status(route[0])
+        if status is None:
+            return self._send_json(404, {"error": "unknown job"})
+        if len(route) == 1:
+            return self._send_json(200, status)
+        if status["status"] != "done":
+            return self._send_json(409, {"error": f"job is {status['status']}"})
+        output = self.jobs.output(route[0])
+        if output is None:
+            # Deleted in the meantime
+            return self._send_json(404, {"error": "unknown job"})
+        self._stream_output(output)
+
+    def _stream_output(self, output):
+        try:
+            f = open(output, "rb")
+        except OSError as e:
+            return self._send_json(410, {"error": f"output is gone: {e}"})
+        with f:
+            content_type = format_for_path(output).content_type
+            self.send_response(200)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(os.fstat(f.fileno()).st_size))
+            self.send_header("Content-Disposition", f'attachment; filename="{os.path.basename(output)}"')
+            self.end_headers()
+            shutil.copyfileobj(f, self.wfile, STREAM_CHUNK)
+
+    def do_DELETE(self):
+        if not self._allowed():
+            return
+        route = self._route()
+        if not route or len(route) != 1:
+            return self._send_json(404, {"error": "not found"})
+        removed = self.jobs.remove(route[0])
+        if removed is None:
+            return self._send_json(404, {"error": "unknown job"})
+        if not removed:
+            return self._send_json(409, {"error": "job is running"})
+        self._send_json(200, {"id": route[0], "removed": True})
+
+
+def make_server(jobs, host=DEFAULT_HOST, port=DEFAULT_PORT, verbose=False):
+    """
+    Creates the HTTP server for `jobs`. Only loopback addresses are accepted for `host`.
+    """
+    if not is_loopback(host):
+        raise ValueError(f"refusing to listen on non-local address '{host}'")
+    handler = type("Handler", (RequestHandler,), {"jobs": jobs})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    server.verbose = verbose
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve PNG sequence conversions over HTTP on localhost.")
+    parser.add_argument("--host", default=DEFAULT_HOST, help=f"Loopback address to bind (default: {DEFAULT_HOST}).")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT, help=f"Port (default: {DEFAULT_PORT}).")
+    parser.add_argument("--workers", type=int, default=DEFAULT_SERVER_WORKERS,
+                        help=f"Worker processes, i.e. jobs converted at once (default: {DEFAULT_SERVER_WORKERS}).")
+    parser.add_argument("--max-pending", type=int, default=DEFAULT_MAX_PENDING,
+                        help=f"Unfinished jobs accepted before refusing new ones (default: {DEFAULT_MAX_PENDING}).")
+    parser.add_argument("--output-dir", help="Folder for outputs of jobs without an output path (default: a temp folder).")
+    parser.add_argument("--verbose", action="store_true", help="Log every request.")
+    args = parser.parse_args()
+
+    if not is_loopback(args.host):
+        print(f"Error: '{args.host}' is not a loopback address; the server only listens on localhost.")
+        sys.exit(1)
+
+    jobs = JobQueue(args.workers, args.max_pending, args.output_dir)
+    print(f"Starting {jobs.workers} worker processes...")
+    print(f"Workers ready in {jobs.warm_up():.2f}s.")
+    server = make_server(jobs, args.host, args.port, args.verbose)
+    print(f"Listening on http://{args.host}:{server.server_port}/jobs")
+    # Stop as cleanly on SIGTERM as on Ctrl+C
+    signal.signal(signal.SIGTERM, signal.default_int_handler)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        jobs.shutdown()
+
+
+if __name__ == "__main__":
+    main()
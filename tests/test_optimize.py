@@ -0,0 +1,141 @@
+import io
+import os
+import sys
+
+import numpy as np
+import pytest
+from PIL import Image
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from optimize import collapse_duplicates, write_apng, write_gif  # noqa: E402
+
+WIDTH, HEIGHT, COUNT = 64, 48, 8
+
+# Few distinct colors, so GIF quantization is exact and frames can be compared pixel for pixel
+COLORS = np.array([[230, 80, 40], [40, 120, 230], [250, 250, 250], [20, 20, 20]], dtype=np.uint8)
+
+
+def sprite_frames(partial_alpha=False):
+    """
+    A static background with a hole, a moving square and a shrinking opaque band, so that
+    frames change small rectangles and pixels turn both opaque and transparent.
+    """
+    frames = []
+    for i in range(COUNT):
+        frame = np.zeros((HEIGHT, WIDTH, 4), dtype=np.uint8)
+        frame[:, :, :3] = COLORS[3]
+        frame[:, :, 3] = 255
+        frame[10:20, 40:60, 3] = 0  # hole
+        frame[:, :WIDTH - 6 * i, :3] = COLORS[2]
+        frame[HEIGHT - 8:, WIDTH - 6 * i:, 3] = 0  # band shrinking to transparent
+        x = 4 + 5 * i
+        frame[20:32, x:x + 12, :3] = COLORS[i % 3]
+        frame[20:32, x:x + 12, 3] = 128 if partial_alpha else 255
+        if i in (3, 4):
+            frames.append(frames[-1].copy())  # held frame
+            continue
+        frames.append(frame)
+    return frames
+
+
+def decoded_frames(data):
+    with Image.open(io.BytesIO(data)) as img:
+        frames, durations = [], []
+        for n in range(img.n_frames):
+            img.seek(n)
+            frames.append(np.asarray(img.convert("RGBA")))
+            durations.append(img.info.get("duration"))
+    return frames, durations
+
+
+def assert_same_pixels(decoded, source):
+    # Transparent pixels may carry any color
+    opaque = source[:, :, 3] > 0
+    np.testing.assert_array_equal(decoded[:, :, 3] > 0, opaque)
+    np.testing.assert_array_equal(decoded[opaque][:, :3], source[opaque][:, :3])
+
+
+def expand_held(frames, durations, step):
+    # Unchanged frames are merged into the previous frame's duration; repeat them back
+    expanded = []
+    for frame, duration in zip(frames, durations):
+        expanded += [frame] * int(round(duration / step))
+    return expanded
+
+
+def test_gif_round_trip():
+    source = sprite_frames()
+    output = io.BytesIO()
+    assert write_gif(source, output, 50)
+
+    frames, durations = decoded_frames(output.getvalue())
+    assert len(frames) < COUNT  # the held frame is merged, and rectangles are partial
+    frames = expand_held(frames, durations, 50)
+    assert len(frames) == COUNT
+    for decoded, expected in zip(frames, source):
+        assert_same_pixels(decoded, expected)
+
+
+def test_apng_round_trip():
+    source = sprite_frames(partial_alpha=True)
+    output = io.BytesIO()
+    write_apng(source, output, 50)
+
+    frames, durations = decoded_frames(output.getvalue())
+    frames = expand_held(frames, durations, 50)
+    assert len(frames) == COUNT
+    for decoded, expected in zip(frames, source):
+        np.testing.assert_array_equal(decoded, expected)
+
+
+@pytest.mark.parametrize("durations", [[30, 40, 50, 60, 70, 80, 90, 100]])
+def test_gif_per_frame_durations(durations):
+    source = sprite_frames()
+    output = io.BytesIO()
+    write_gif(source, output, durations)
+
+    _, decoded = decoded_frames(output.getvalue())
+    # Frames 3 and 4 repeat frame 2 and extend its duration
+    assert decoded == [30, 40, 50 + 60 + 70, 80, 90, 100]
+
+
+def test_gif_full_motion_is_not_written():
+    rng = np.random.default_rng(0)
+    source = [COLORS[rng.integers(0, len(COLORS), (HEIGHT, WIDTH))] for _ in range(COUNT)]
+    output = io.BytesIO()
+    assert not write_gif(source, output, 50, max_coverage=0.5)
+    assert output.getvalue() == b""
+
+
+def gray(value, shape=(HEIGHT, WIDTH, 4)):
+    return np.full(shape, value, dtype=np.uint8)
+
+
+def test_collapse_exact_duplicates():
+    frames = [gray(0), gray(0), gray(10), gray(10), gray(10), gray(0)]
+    kept, durations = collapse_duplicates(frames, 40)
+    assert [int(frame[0, 0, 0]) for frame in kept] == [0, 10, 0]
+    assert durations == [80, 120, 40]
+
+
+def test_collapse_per_frame_durations_and_images():
+    frames = [Image.fromarray(gray(v)) for v in (5, 5, 6)]
+    kept, durations = collapse_duplicates(frames, [10, 20, 30])
+    assert kept == [frames[0], frames[2]]
+    assert durations == [30, 30]
+
+
+def test_collapse_threshold_compares_with_kept_frame():
+    # Each step is within the threshold of its predecessor, but the fade drifts past it
+    frames = [gray(v) for v in (0, 2, 4, 6, 8)]
+    kept, durations = collapse_duplicates(frames, 10, threshold=5)
+    assert [int(frame[0, 0, 0]) for frame in kept] == [0, 6]
+    assert durations == [30, 20]
+    assert len(collapse_duplicates(frames, 10)[0]) == len(frames)  # exact only by default
+
+
+def test_collapse_keeps_frames_of_other_sizes():
+    frames = [gray(0), gray(0, (HEIGHT, WIDTH + 1, 4)), gray(0, (HEIGHT, WIDTH + 1, 4))]
+    kept, durations = collapse_duplicates(frames, 10)
+    assert len(kept) == 2 and durations == [10, 20]
@@ -0,0 +1,85 @@
+import os
+import sys
+
+import numpy as np
+from PIL import Image
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from preflight import find_gaps, natural_key, read_png_header, scan_frames  # noqa: E402
+
+
+def write_png(path, width=16, height=8, mode="RGBA"):
+    Image.fromarray(np.zeros((height, width, len(mode)), dtype=np.uint8).squeeze(), mode).save(path)
+    return path
+
+
+def test_natural_key_orders_numbers_by_value():
+    names = ["frame10.png", "Frame2.png", "frame1.png", "frame_b.png", "frame_a.png"]
+    assert sorted(names, key=natural_key) == ["frame1.png", "Frame2.png", "frame10.png", "frame_a.png", "frame_b.png"]
+
+
+def test_natural_key_keeps_padding_apart():
+    # Same number with different padding: distinct, and in a stable order
+    assert sorted(["f01.png", "f1.png"], key=natural_key) == ["f01.png", "f1.png"]
+
+
+def test_find_gaps():
+    files = ["a_0001.png", "a_0002.png", "a_0005.png", "a_0007.png", "b_1.png", "b_2.png", "title.png"]
+    assert find_gaps(files) == [("a_0003.png", "a_0004.png", 2), ("a_0006.png", "a_0006.png", 1)]
+
+
+def test_find_gaps_checks_sequences_separately():
+    files = ["left_001.png", "left_002.png", "right_005.png", "right_006.png"]
+    assert find_gaps(files) == []
+
+
+def test_read_png_header(tmp_path):
+    path = write_png(tmp_path / "frame.png", 16, 8, "RGBA")
+    assert read_png_header(path) == {"width": 16, "height": 8, "bit_depth": 8, "mode": "RGBA"}
+    assert read_png_header(write_png(tmp_path / "gray.png", 4, 4, "L"))["mode"] == "L"
+
+
+def test_read_png_header_truncated(tmp_path):
+    data = write_png(tmp_path / "frame.png").read_bytes()
+    path = tmp_path / "truncated.png"
+    path.write_bytes(data[:-20])
+    assert read_png_header(path) == {"error": "truncated"}
+    path.write_bytes(data[:20])
+    assert read_png_header(path) == {"error": "not a PNG file"}
+
+
+def test_read_png_header_bad_crc(tmp_path):
+    data = bytearray(write_png(tmp_path / "frame.png").read_bytes())
+    data[17] ^= 0xFF  # width, inside the IHDR chunk its CRC covers
+    path = tmp_path / "corrupt.png"
+    path.write_bytes(bytes(data))
+    assert read_png_header(path) == {"error": "corrupt header"}
+
+
+def test_read_png_header_trailing_bytes(tmp_path):
+    # The file must end with IEND, so trailing bytes are reported like a cut-off file
+    path = tmp_path / "trailing.png"
+    path.write_bytes(write_png(tmp_path / "frame.png").read_bytes() + b"junk")
+    assert read_png_header(path) == {"error": "truncated"}
+
+
+def test_read_png_header_not_png(tmp_path):
+    path = tmp_path / "text.png"
+    path.write_bytes(b"not an image at all, just some text")
+    assert read_png_header(path) == {"error": "not a PNG file"}
+    assert "error" in read_png_header(tmp_path / "missing.png")
+
+
+def test_scan_frames_reports_problems(tmp_path):
+    for i in (1, 2, 4):
+        write_png(tmp_path / f"frame_{i:03d}.png")
+    write_png(tmp_path / "frame_005.png", 32, 8)
+    (tmp_path / "frame_006.png").write_bytes(b"broken")
+
+    report = scan_frames(str(tmp_path), index_dir=None)
+    assert report["files"] == [f"frame_{i:03d}.png" for i in (1, 2, 4, 5, 6)]
+    assert (report["width"], report["height"], report["mode"]) == (16, 8, "RGBA")
+    assert report["size_mismatches"] == [("frame_005.png", "32x8")]
+    assert report["corrupt"] == [("frame_006.png", "not a PNG file")]
+    assert report["gaps"] == [("frame_003.png", "frame_003.png", 1)]
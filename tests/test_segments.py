@@ -0,0 +1,35 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from convert import segment_alignment, split_segments  # noqa: E402
+
+
+@pytest.mark.parametrize("count, segments, align", [(100, 4, 1), (101, 3, 1), (97, 4, 3), (10, 8, 4), (1, 4, 1)])
+def test_split_segments_covers_every_frame_once(count, segments, align):
+    ranges = split_segments(count, segments, align)
+    assert 1 <= len(ranges) <= segments
+    assert ranges[0][0] == 0 and ranges[-1][1] == count
+    for (_, end), (start, _) in zip(ranges, ranges[1:]):
+        assert end == start
+    assert all(start % align == 0 and end > start for start, end in ranges)
+
+
+def test_split_segments_near_equal():
+    assert split_segments(100, 4) == [(0, 25), (25, 50), (50, 75), (75, 100)]
+    assert split_segments(10, 3) == [(0, 3), (3, 6), (6, 10)]
+
+
+def test_split_segments_fewer_blocks_than_segments():
+    # 10 frames in blocks of 4 only make 3 aligned segments
+    assert split_segments(10, 8, 4) == [(0, 4), (4, 8), (8, 10)]
+
+
+@pytest.mark.parametrize("fps, align", [(24, 3), (25, 1), (30, 3), (50, 1), (60, 3), (120, 3), (1000, 1), (7, 7)])
+def test_segment_alignment(fps, align):
+    assert segment_alignment(fps) == align
+    # That many frames last a whole number of milliseconds
+    assert (align * 1000) % fps == 0